@@ -3,17 +3,24 @@ Smart Attendance System - Flask Backend API
 Complete API with duplicate prevention and accurate attendance
 """
 
-from flask import Flask, jsonify, send_file, request, render_template
+from flask import Flask, jsonify, request, render_template, Response, stream_with_context
 from flask_cors import CORS
 import csv
 import os
-import json
 import sys
-import subprocess
 import shutil
+import threading
+import hashlib
+import heapq
+import mmap
+import re
+from collections import defaultdict
+from functools import lru_cache
 from datetime import datetime
 from config import Config
 from validators import StudentValidator, AttendanceValidator, ValidationError
+import recognize_attendance
+from json_utils import json_loads
 
 app = Flask(__name__)
 @app.route("/")
@@ -24,27 +31,272 @@ CORS(app)
 # Global variable to track attendance status
 attendance_running = False
 
+# In-process recognition thread and that session's own stop event
+_attendance_thread = None
+_attendance_stop = None
+
+# Seconds start_attendance waits for a stopped session to release the camera
+SESSION_STOP_TIMEOUT = 10
+
+# Backup file naming: every backup shares one prefix so cleanup is a single check
+BACKUP_PREFIX = "bk_"
+BACKUP_DB_PREFIX = "bk_db_"
+BACKUP_ATTENDANCE_PREFIX = "bk_att_"
+_LEGACY_BACKUP_RE = re.compile(r"^(student_database|attendance)_(\d{8}_\d{6})\.(json|csv)$")
+
+# Today's attendance payload per class, keyed on
+# (date, branch, section, attendance_csv_mtime_ns, student_db_mtime_ns)
+_TODAY_CACHE = {}
+
+# Guards _TODAY_CACHE and _DB_CACHE: waitress serves requests from several threads
+_CACHE_LOCK = threading.Lock()
+
+
+# Parsed student database, reused until the file's mtime/size changes.
+# by_class / by_class_count index students by (branch, section) per load.
+_DB_CACHE = {
+    "mtime": None,
+    "size": None,
+    "data": {},
+    "by_class": {},
+    "by_class_count": {}
+}
+
+
+def invalidate_student_cache():
+    """Force the next load_student_database() call to re-read the file"""
+    with _CACHE_LOCK:
+        _DB_CACHE["mtime"] = None
+        _DB_CACHE["size"] = None
+
+
+def _build_class_index(db):
+    """Group students by (branch, section) in a single pass over the database"""
+    by_class = defaultdict(list)
+    by_class_count = defaultdict(int)
+    
+    for info in db.values():
+        class_key = (info.get('branch', 'UNKNOWN'), info.get('section', 'UNKNOWN'))
+        by_class[class_key].append({
+            'name': info.get('name', 'Unknown'),
+            'rollNo': info.get('rollNo', ''),
+            'images': info.get('imagesCount', 0),
+            'registered': info.get('registeredDate', 'N/A')
+        })
+        by_class_count[class_key] += 1
+    
+    return dict(by_class), dict(by_class_count)
+
+
+def _store_student_cache(mtime, size, data):
+    """Swap in a freshly loaded database and its class index under the cache lock"""
+    by_class, by_class_count = _build_class_index(data)
+    with _CACHE_LOCK:
+        _DB_CACHE["mtime"] = mtime
+        _DB_CACHE["size"] = size
+        _DB_CACHE["data"] = data
+        _DB_CACHE["by_class"] = by_class
+        _DB_CACHE["by_class_count"] = by_class_count
+
 
 def load_student_database():
-    """Load student database from JSON"""
-    if os.path.exists(Config.STUDENT_DB):
-        try:
-            with open(Config.STUDENT_DB, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading database: {e}")
-            return {}
-    return {}
+    """Load student database from JSON (cached until the file changes)"""
+    try:
+        st = os.stat(Config.STUDENT_DB)
+    except OSError:
+        _store_student_cache(None, None, {})
+        return {}
+    
+    with _CACHE_LOCK:
+        if st.st_mtime_ns == _DB_CACHE["mtime"] and st.st_size == _DB_CACHE["size"]:
+            return _DB_CACHE["data"]
+    
+    try:
+        with open(Config.STUDENT_DB, 'rb') as f:
+            data = json_loads(f.read())
+    except Exception as e:
+        print(f"Error loading database: {e}")
+        return {}
+    
+    _store_student_cache(st.st_mtime_ns, st.st_size, data)
+    return data
+
+
+def get_class_counts():
+    """Return {(branch, section): student_count} for the current database"""
+    load_student_database()
+    with _CACHE_LOCK:
+        return _DB_CACHE["by_class_count"]
 
 
 def count_students_in_class(branch, section):
     """Count actual registered students in a specific class"""
-    db = load_student_database()
-    count = 0
-    for student_id, info in db.items():
-        if info.get('branch') == branch and info.get('section') == section:
-            count += 1
-    return count
+    return get_class_counts().get((branch, section), 0)
+
+
+def _column(fields, idx, default=''):
+    """Safely fetch a stripped column value from a parsed CSV row"""
+    if idx is None or idx >= len(fields):
+        return default
+    return fields[idx].strip()
+
+
+def scan_csv_lines(path, needle):
+    """
+    Yield the header line of a CSV, then only the lines containing needle.
+    The file is memory-mapped and non-matching rows are skipped by
+    mmap.find() without being decoded or copied.
+    """
+    needle_bytes = needle.encode('utf-8')
+    
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file cannot be mapped
+            return
+        
+        with mm:
+            size = len(mm)
+            header_end = mm.find(b'\n')
+            pos = size if header_end == -1 else header_end + 1
+            yield mm[:pos].decode('utf-8')
+            
+            while pos < size:
+                hit = mm.find(needle_bytes, pos)
+                if hit == -1:
+                    break
+                
+                line_start = mm.rfind(b'\n', pos, hit)
+                line_start = pos if line_start == -1 else line_start + 1
+                line_end = mm.find(b'\n', hit)
+                line_end = size if line_end == -1 else line_end + 1
+                
+                yield mm[line_start:line_end].decode('utf-8')
+                pos = line_end
+
+
+def read_attendance_for_day(day, branch, section):
+    """
+    Scan the attendance CSV and return unique records for one class/day.
+    Only lines containing the date string are parsed.
+    """
+    records = []
+    # Track unique students (prevent duplicate counting)
+    present_students = set()
+    
+    lines = scan_csv_lines(Config.ATTENDANCE_CSV, day)
+    header_line = next(lines, '')
+    header = [h.strip() for h in next(csv.reader([header_line]), [])]
+    idx = {name: i for i, name in enumerate(header)}
+    
+    date_idx = idx.get('Date')
+    branch_idx = idx.get('Branch')
+    section_idx = idx.get('Section')
+    roll_idx = idx.get('RollNo')
+    name_idx = idx.get('Name')
+    time_idx = idx.get('Time')
+    
+    for line in lines:
+        fields = next(csv.reader([line]), [])
+        if (_column(fields, date_idx) != day or
+                _column(fields, branch_idx) != branch or
+                _column(fields, section_idx) != section):
+            continue
+        
+        # Only count unique students (in case of duplicate entries)
+        roll_no = _column(fields, roll_idx)
+        if roll_no in present_students:
+            continue
+        present_students.add(roll_no)
+        
+        records.append({
+            'name': _column(fields, name_idx, 'Unknown'),
+            'rollNo': roll_no,
+            'date': _column(fields, date_idx),
+            'time': _column(fields, time_idx)
+        })
+    
+    return records
+
+
+def _mtime_ns(path):
+    """File mtime in nanoseconds, or 0 if the file doesn't exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+@lru_cache(maxsize=32)
+def _validate_class(branch, section):
+    """Memoized class validation (only successful pairs are cached)"""
+    return AttendanceValidator.validate_class_selection(branch, section)
+
+
+def parse_class_args():
+    """
+    Read and validate branch/section query parameters
+    
+    Returns:
+        (str, str): Upper-cased branch and section
+    
+    Raises:
+        ValidationError: If the class selection is invalid
+    """
+    args = request.args
+    branch = sys.intern(args.get('branch', '').upper())
+    section = sys.intern(args.get('section', '').upper())
+    _validate_class(branch, section)
+    return branch, section
+
+
+def _etag_for(paths, extra=()):
+    """Weak ETag derived from file mtimes/sizes plus request-specific values"""
+    h = hashlib.blake2b(digest_size=10)
+    for path in paths:
+        try:
+            st = os.stat(path)
+            h.update(f"{path}|{st.st_mtime_ns}|{st.st_size};".encode())
+        except OSError:
+            h.update(f"{path}|missing;".encode())
+    h.update(repr(tuple(extra)).encode())
+    return f'W/"{h.hexdigest()}"'
+
+
+def _not_modified(etag):
+    """Return a 304 response if the client already has this ETag, else None"""
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag, 'Cache-Control': 'no-cache'}
+    return None
+
+
+def _with_etag(response, etag):
+    """Attach ETag and revalidation headers to a successful response"""
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def migrate_legacy_backups():
+    """Rename backups made before the bk_ naming scheme so cleanup sees them"""
+    try:
+        with os.scandir(Config.BACKUP_PATH) as entries:
+            names = [entry.name for entry in entries]
+        
+        for name in names:
+            match = _LEGACY_BACKUP_RE.match(name)
+            if not match:
+                continue
+            
+            kind, timestamp, ext = match.groups()
+            prefix = BACKUP_DB_PREFIX if kind == "student_database" else BACKUP_ATTENDANCE_PREFIX
+            os.replace(
+                os.path.join(Config.BACKUP_PATH, name),
+                os.path.join(Config.BACKUP_PATH, f"{prefix}{timestamp}.{ext}")
+            )
+    except Exception as e:
+        print(f"Backup migration error: {e}")
 
 
 def backup_database():
@@ -59,7 +311,7 @@ def backup_database():
         if os.path.exists(Config.STUDENT_DB):
             backup_file = os.path.join(
                 Config.BACKUP_PATH,
-                f"student_database_{timestamp}.json"
+                f"{BACKUP_DB_PREFIX}{timestamp}.json"
             )
             shutil.copy2(Config.STUDENT_DB, backup_file)
             print(f"✅ Database backed up: {backup_file}")
@@ -68,40 +320,54 @@ def backup_database():
         if os.path.exists(Config.ATTENDANCE_CSV):
             backup_file = os.path.join(
                 Config.BACKUP_PATH,
-                f"attendance_{timestamp}.csv"
+                f"{BACKUP_ATTENDANCE_PREFIX}{timestamp}.csv"
             )
             shutil.copy2(Config.ATTENDANCE_CSV, backup_file)
         
-        # Clean old backups (keep last 10)
+        # Clean old backups (keep last N of each kind)
         cleanup_old_backups()
         
     except Exception as e:
         print(f"Backup error: {e}")
+    finally:
+        invalidate_student_cache()
 
 
 def cleanup_old_backups():
-    """Remove old backup files, keep last N"""
+    """Remove old backup files, keep the last N of each kind (database, attendance)"""
     try:
-        backups = [
-            f for f in os.listdir(Config.BACKUP_PATH)
-            if f.startswith("student_database_") or f.startswith("attendance_")
-        ]
-        
-        backups.sort(reverse=True)
+        with os.scandir(Config.BACKUP_PATH) as entries:
+            names = [entry.name for entry in entries if entry.name.startswith(BACKUP_PREFIX)]
         
-        # Remove backups beyond limit
-        for backup in backups[Config.MAX_BACKUP_FILES:]:
-            os.remove(os.path.join(Config.BACKUP_PATH, backup))
+        for prefix in (BACKUP_DB_PREFIX, BACKUP_ATTENDANCE_PREFIX):
+            backups = [name for name in names if name.startswith(prefix)]
+            if len(backups) <= Config.MAX_BACKUP_FILES:
+                continue
+            
+            # Rank by the YYYYmmdd_HHMMSS stamp in the name (sorts lexically).
+            # Not st_mtime: copy2 keeps the source file's mtime, so copies of
+            # an unchanged database would all look old.
+            keep = set(heapq.nlargest(Config.MAX_BACKUP_FILES, backups))
+            
+            # Remove backups beyond limit
+            for name in backups:
+                if name not in keep:
+                    os.remove(os.path.join(Config.BACKUP_PATH, name))
     except Exception as e:
         print(f"Cleanup error: {e}")
 
 
-@app.route("/")
+@app.route("/api")
 def api_home():
     """API health check"""
+    etag = _etag_for([Config.STUDENT_DB])
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    
     db = load_student_database()
     
-    return jsonify({
+    return _with_etag(jsonify({
         "message": "Smart Attendance Backend Running",
         "status": "active",
         "version": "2.0",
@@ -110,7 +376,7 @@ def api_home():
             "branches": Config.ALLOWED_BRANCHES,
             "sections": Config.ALLOWED_SECTIONS
         }
-    })
+    }), etag)
 
 
 @app.route("/api/attendance/today", methods=['GET'])
@@ -120,72 +386,53 @@ def get_today_attendance():
     Query params: branch, section
     """
     try:
-        branch = request.args.get('branch', '').upper()
-        section = request.args.get('section', '').upper()
-        
         # Validate inputs
         try:
-            AttendanceValidator.validate_class_selection(branch, section)
+            branch, section = parse_class_args()
         except ValidationError as e:
             return jsonify({
                 "success": False,
                 "error": str(e)
             }), 400
         
-        print(f"📊 Loading attendance for: {branch}-{section}")
-        
         today = str(datetime.now().date())
-        records = []
-        present_count = 0
-        
-        # Get actual student count from database
-        total_students = count_students_in_class(branch, section)
-        
-        if total_students == 0:
-            return jsonify({
-                "success": False,
-                "error": f"No students registered in {branch}-{section}"
-            }), 404
-        
-        # Read attendance records
-        if os.path.exists(Config.ATTENDANCE_CSV):
-            with open(Config.ATTENDANCE_CSV, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                
-                # Track unique students (prevent duplicate counting)
-                present_students = set()
-                
-                for row in reader:
-                    row_date = str(row.get('Date', '')).strip()
-                    row_branch = str(row.get('Branch', '')).strip()
-                    row_section = str(row.get('Section', '')).strip()
-                    roll_no = str(row.get('RollNo', '')).strip()
-                    
-                    if (row_date == today and 
-                        row_branch == branch and 
-                        row_section == section):
-                        
-                        # Only count unique students (in case of duplicate entries)
-                        if roll_no not in present_students:
-                            present_students.add(roll_no)
-                            
-                            records.append({
-                                'name': row.get('Name', 'Unknown'),
-                                'rollNo': roll_no,
-                                'date': row.get('Date', ''),
-                                'time': row.get('Time', '')
-                            })
-                
-                present_count = len(present_students)
         
-        absent_count = total_students - present_count
-        percentage = (present_count / total_students * 100) if total_students > 0 else 0
+        etag = _etag_for([Config.STUDENT_DB, Config.ATTENDANCE_CSV], (today, branch, section))
+        cached = _not_modified(etag)
+        if cached:
+            return cached
         
-        print(f"✅ Found {present_count}/{total_students} present for {branch}-{section} ({percentage:.1f}%)")
+        # Reuse the payload until either attendance.csv or the database changes
+        csv_mtime = _mtime_ns(Config.ATTENDANCE_CSV)
+        db_mtime = _mtime_ns(Config.STUDENT_DB)
+        cache_key = (today, branch, section, csv_mtime, db_mtime)
         
-        return jsonify({
-            "success": True,
-            "data": {
+        with _CACHE_LOCK:
+            payload = _TODAY_CACHE.get(cache_key)
+        if payload is None:
+            print(f"📊 Loading attendance for: {branch}-{section}")
+            
+            # Get actual student count from database
+            total_students = count_students_in_class(branch, section)
+            
+            if total_students == 0:
+                return jsonify({
+                    "success": False,
+                    "error": f"No students registered in {branch}-{section}"
+                }), 404
+            
+            # Read attendance records
+            records = []
+            if csv_mtime:
+                records = read_attendance_for_day(today, branch, section)
+            present_count = len(records)
+            
+            absent_count = total_students - present_count
+            percentage = (present_count / total_students * 100) if total_students > 0 else 0
+            
+            print(f"✅ Found {present_count}/{total_students} present for {branch}-{section} ({percentage:.1f}%)")
+            
+            payload = {
                 "class": f"{branch}-{section}",
                 "date": today,
                 "total": total_students,
@@ -194,7 +441,17 @@ def get_today_attendance():
                 "percentage": round(percentage, 2),
                 "records": records
             }
-        })
+            
+            # Drop entries from previous days or older file versions of this class
+            with _CACHE_LOCK:
+                for stale in [k for k in _TODAY_CACHE if k[0] != today or k[1:3] == cache_key[1:3]]:
+                    del _TODAY_CACHE[stale]
+                _TODAY_CACHE[cache_key] = payload
+        
+        return _with_etag(jsonify({
+            "success": True,
+            "data": payload
+        }), etag)
         
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -210,29 +467,31 @@ def get_today_attendance():
 def get_class_stats():
     """Get statistics for a specific class"""
     try:
-        branch = request.args.get('branch', '').upper()
-        section = request.args.get('section', '').upper()
+        try:
+            branch, section = parse_class_args()
+        except ValidationError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
-        db = load_student_database()
+        etag = _etag_for([Config.STUDENT_DB], (branch, section))
+        cached = _not_modified(etag)
+        if cached:
+            return cached
         
-        students = []
-        for student_id, info in db.items():
-            if info.get('branch') == branch and info.get('section') == section:
-                students.append({
-                    'name': info['name'],
-                    'rollNo': info['rollNo'],
-                    'images': info.get('imagesCount', 0),
-                    'registered': info.get('registeredDate', 'N/A')
-                })
+        load_student_database()
+        with _CACHE_LOCK:
+            students = _DB_CACHE["by_class"].get((branch, section), [])
         
-        return jsonify({
+        return _with_etag(jsonify({
             "success": True,
             "data": {
                 "class": f"{branch}-{section}",
                 "totalStudents": len(students),
                 "students": sorted(students, key=lambda x: x['rollNo'])
             }
-        })
+        }), etag)
     
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -246,36 +505,31 @@ def get_class_stats():
 def get_classes_summary():
     """Get summary of all classes with student counts"""
     try:
-        db = load_student_database()
+        etag = _etag_for([Config.STUDENT_DB])
+        cached = _not_modified(etag)
+        if cached:
+            return cached
         
-        # Count students by class
-        class_counts = {}
-        for student_id, info in db.items():
-            branch = info.get('branch', 'UNKNOWN')
-            section = info.get('section', 'UNKNOWN')
-            class_key = f"{branch}-{section}"
-            class_counts[class_key] = class_counts.get(class_key, 0) + 1
+        db = load_student_database()
         
-        # Format response
+        # Format response from the per-class counts
         classes = []
-        for class_key, count in sorted(class_counts.items()):
-            if '-' in class_key:
-                branch, section = class_key.split('-')
-                classes.append({
-                    'branch': branch,
-                    'section': section,
-                    'class': class_key,
-                    'students': count
-                })
-        
-        return jsonify({
+        for (branch, section), count in sorted(get_class_counts().items()):
+            classes.append({
+                'branch': branch,
+                'section': section,
+                'class': f"{branch}-{section}",
+                'students': count
+            })
+        
+        return _with_etag(jsonify({
             "success": True,
             "data": {
                 "totalClasses": len(classes),
                 "totalStudents": len(db),
                 "classes": classes
             }
-        })
+        }), etag)
     
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -288,7 +542,7 @@ def get_classes_summary():
 @app.route("/api/attendance/start", methods=['POST'])
 def start_attendance():
     """Start attendance recognition system"""
-    global attendance_running
+    global attendance_running, _attendance_thread, _attendance_stop
     
     try:
         data = request.json
@@ -315,8 +569,8 @@ def start_attendance():
                 "message": str(e)
             }), 400
         
-        # Check if already running
-        if attendance_running:
+        # Check if already running (the session may also end from the camera window)
+        if attendance_running and _attendance_thread is not None and _attendance_thread.is_alive():
             return jsonify({
                 "success": False,
                 "message": "Attendance system already running. Please stop it first."
@@ -329,26 +583,26 @@ def start_attendance():
                 "message": "Model not trained! Please run: python train_model.py"
             }), 400
         
-        # Create batch file to run recognition script
-        batch_content = f"""@echo off
-cd /d "{os.getcwd()}"
-python recognize_attendance.py {branch} {section}
-"""
-        
-        batch_file = "run_attendance.bat"
-        with open(batch_file, 'w') as f:
-            f.write(batch_content)
-        
-        print(f"✅ Created batch file: {batch_file}")
-        
-        # Launch recognition system
-        if sys.platform == 'win32':
-            subprocess.Popen(
-                ['cmd', '/c', 'start', 'cmd', '/k', batch_file],
-                creationflags=subprocess.CREATE_NEW_CONSOLE
-            )
-        else:
-            subprocess.Popen(['python', 'recognize_attendance.py', branch, section])
+        # A stopped session may still be in setup or releasing the camera;
+        # make sure it is gone before a new one opens it
+        if _attendance_thread is not None and _attendance_thread.is_alive():
+            _attendance_stop.set()
+            _attendance_thread.join(timeout=SESSION_STOP_TIMEOUT)
+            if _attendance_thread.is_alive():
+                return jsonify({
+                    "success": False,
+                    "message": "Previous attendance session is still stopping. Please try again."
+                }), 409
+        
+        # Launch recognition system in this process, with a fresh stop event
+        # so a late stop can never be cleared before the old session sees it
+        _attendance_stop = threading.Event()
+        _attendance_thread = threading.Thread(
+            target=recognize_attendance.run,
+            args=(branch, section, _attendance_stop),
+            daemon=True
+        )
+        _attendance_thread.start()
         
         attendance_running = True
         
@@ -377,12 +631,14 @@ def stop_attendance():
     
     try:
         attendance_running = False
+        if _attendance_stop is not None:
+            _attendance_stop.set()
         
-        print("⏹️ Attendance stopped (close the camera window manually)")
+        print("⏹️ Attendance stopped")
         
         return jsonify({
             "success": True,
-            "message": "Attendance stopped. Please close the camera window."
+            "message": "Attendance stopped."
         })
         
     except Exception as e:
@@ -397,8 +653,13 @@ def stop_attendance():
 def export_attendance():
     """Export attendance records as CSV"""
     try:
-        branch = request.args.get('branch', '').upper()
-        section = request.args.get('section', '').upper()
+        try:
+            branch, section = parse_class_args()
+        except ValidationError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
         if not os.path.exists(Config.ATTENDANCE_CSV):
             return jsonify({
@@ -406,30 +667,29 @@ def export_attendance():
                 "error": "Attendance file not found"
             }), 404
         
-        # Create filtered CSV
         timestamp = datetime.now().strftime('%Y%m%d')
-        filtered_file = os.path.join(
-            Config.BACKUP_PATH,
-            f"attendance_{branch}_{section}_{timestamp}.csv"
-        )
-        
-        with open(Config.ATTENDANCE_CSV, 'r', encoding='utf-8') as infile:
-            reader = csv.DictReader(infile)
+        download_name = f"attendance_{branch}_{section}_{timestamp}.csv"
+        
+        def generate():
+            """Yield the header and matching rows straight from attendance.csv"""
+            lines = scan_csv_lines(Config.ATTENDANCE_CSV, branch)
+            header_line = next(lines, '')
+            header = next(csv.reader([header_line]), [])
+            branch_idx = header.index('Branch') if 'Branch' in header else None
+            section_idx = header.index('Section') if 'Section' in header else None
             
-            with open(filtered_file, 'w', newline='', encoding='utf-8') as outfile:
-                fieldnames = reader.fieldnames
-                writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for row in reader:
-                    if row.get('Branch', '') == branch and row.get('Section', '') == section:
-                        writer.writerow(row)
-        
-        return send_file(
-            filtered_file,
+            yield header_line
+            
+            for line in lines:
+                fields = next(csv.reader([line]), [])
+                if (_column(fields, branch_idx) == branch and
+                        _column(fields, section_idx) == section):
+                    yield line
+        
+        return Response(
+            stream_with_context(generate()),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'attendance_{branch}_{section}_{timestamp}.csv'
+            headers={'Content-Disposition': f'attachment; filename={download_name}'}
         )
         
     except Exception as e:
@@ -466,23 +726,19 @@ if __name__ == "__main__":
     
     # Create necessary directories
     Config.create_directories()
+    migrate_legacy_backups()
     
     # Check student database
     db = load_student_database()
     print(f"👥 Total students registered: {len(db)}")
     
     # Show class summary
-    class_counts = {}
-    for info in db.values():
-        branch = info.get('branch', 'UNKNOWN')
-        section = info.get('section', 'UNKNOWN')
-        class_key = f"{branch}-{section}"
-        class_counts[class_key] = class_counts.get(class_key, 0) + 1
+    class_counts = get_class_counts()
     
     if class_counts:
         print("📊 Students by class:")
-        for class_key, count in sorted(class_counts.items()):
-            print(f"   {class_key}: {count} students")
+        for (branch, section), count in sorted(class_counts.items()):
+            print(f"   {branch}-{section}: {count} students")
     else:
         print("⚠️  No students registered yet")
         print("   Run: python face_capture.py OR python bulk_capture.py")
@@ -498,9 +754,25 @@ if __name__ == "__main__":
     print(f"🌐 Starting API server on {Config.API_HOST}:{Config.API_PORT}")
     print("=" * 70)
     
-    app.run(
-        debug=Config.API_DEBUG,
-        host=Config.API_HOST,
-        port=Config.API_PORT,
-        use_reloader=False
-    )
\ No newline at end of file
+    if Config.API_DEBUG:
+        # Werkzeug dev server only when explicitly debugging
+        app.run(
+            debug=Config.API_DEBUG,
+            host=Config.API_HOST,
+            port=Config.API_PORT,
+            use_reloader=False
+        )
+    else:
+        try:
+            from waitress import serve
+        except ImportError:
+            print("⚠️  waitress not installed, falling back to Flask dev server")
+            print("   Run: pip install waitress")
+            app.run(
+                host=Config.API_HOST,
+                port=Config.API_PORT,
+                threaded=True,
+                use_reloader=False
+            )
+        else:
+            serve(app, host=Config.API_HOST, port=Config.API_PORT, threads=Config.API_THREADS)
\ No newline at end of file
@@ -1,20 +1,141 @@
 import cv2
 import os
+import sys
 import json
+import atexit
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
+from config import Config
+from json_utils import json_loads, json_dumps
+from face_detection import create_face_detector, detect_faces_yunet
 
 STUDENT_DB = "student_database.json"
+# Per-student append log, merged into STUDENT_DB once per session
+STUDENT_JOURNAL = "student_database.jsonl"
+
+# Smallest face box kept (px). YuNet from face_detection.py is optional;
+# detection falls back to the Haar cascade when its model is missing
+MIN_FACE_SIZE = 120
+
+# Haar detection runs on a frame downscaled by this factor; boxes are
+# scaled back up so crops still come from the full-resolution frame
+DETECTION_SCALE = 2
+
+# Saved face crops use the same JPEG quality as face_capture.py
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, Config.FACE_IMAGE_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+# Loaded once per process and reused by every capture session
+face_cascade = cv2.CascadeClassifier(
+    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+)
+
+_cam = None
+
+def get_cam():
+    """Return the shared camera, opening it on first use (or if it was lost)"""
+    global _cam
+    if _cam is None or not _cam.isOpened():
+        backend = cv2.CAP_DSHOW if sys.platform == 'win32' else cv2.CAP_ANY
+        _cam = cv2.VideoCapture(0, backend)
+        _cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+        _cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        _cam.set(cv2.CAP_PROP_FPS, 30)
+    return _cam
+
+def release_cam():
+    """Release the shared camera (registered with atexit)"""
+    global _cam
+    if _cam is not None:
+        _cam.release()
+        _cam = None
+
+atexit.register(release_cam)
 
 def load_student_database():
+    db = {}
     if os.path.exists(STUDENT_DB):
-        with open(STUDENT_DB, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+        with open(STUDENT_DB, 'rb') as f:
+            db = json_loads(f.read())
+    
+    # Recover students from a session that ended before compaction
+    if os.path.exists(STUDENT_JOURNAL):
+        with open(STUDENT_JOURNAL, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Partially written last line
+                db[entry["id"]] = entry["info"]
+    return db
 
 def save_student_database(db):
-    with open(STUDENT_DB, 'w', encoding='utf-8') as f:
-        json.dump(db, indent=4, fp=f)
+    """Write the database atomically (temp file + rename)"""
+    tmp_file = STUDENT_DB + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(json_dumps(db))
+    os.replace(tmp_file, STUDENT_DB)
+
+def append_student_journal(student_id, info):
+    """Record one new student without rewriting the whole database"""
+    with open(STUDENT_JOURNAL, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"id": student_id, "info": info}) + "\n")
+
+def compact_student_database(db):
+    """Merge the journal into STUDENT_DB once and discard it"""
+    save_student_database(db)
+    if os.path.exists(STUDENT_JOURNAL):
+        os.remove(STUDENT_JOURNAL)
+
+def detect_faces(frame, gray, detector, face_cascade):
+    """Return face boxes as (x, y, w, h), using YuNet when loaded"""
+    if detector is None:
+        gray_h, gray_w = gray.shape[:2]
+        small = cv2.resize(
+            gray,
+            (gray_w // DETECTION_SCALE, gray_h // DETECTION_SCALE),
+            interpolation=cv2.INTER_AREA
+        )
+        min_size = MIN_FACE_SIZE // DETECTION_SCALE
+        faces = face_cascade.detectMultiScale(
+            small, 
+            scaleFactor=1.2, 
+            minNeighbors=5,
+            minSize=(min_size, min_size)
+        )
+        return [
+            (x * DETECTION_SCALE, y * DETECTION_SCALE,
+             w * DETECTION_SCALE, h * DETECTION_SCALE)
+            for (x, y, w, h) in faces
+        ]
+    
+    return detect_faces_yunet(detector, frame, (MIN_FACE_SIZE, MIN_FACE_SIZE))
+
+def encode_jpeg(image):
+    """Encode an image to JPEG bytes (runs on the encoder pool)"""
+    ok, buffer = cv2.imencode(".jpg", image, JPEG_PARAMS)
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer
+
+def image_writer(write_q):
+    """Background thread: write queued (path, encode_future) pairs until None arrives"""
+    while True:
+        item = write_q.get()
+        try:
+            if item is None:
+                return
+            path, encoded = item
+            encoded.result().tofile(path)
+        except Exception as e:
+            print(f"\n❌ Could not save image: {e}")
+        finally:
+            write_q.task_done()
 
 def get_next_roll_number(branch, section, existing_count):
     """Generate sequential roll numbers"""
@@ -97,22 +218,30 @@ def bulk_capture_class():
     
     input("\nPress ENTER to start...")
     
-    # Initialize camera once for all students
-    cam = cv2.VideoCapture(0)
+    # Camera is opened once per process and shared by all students/sessions
+    cam = get_cam()
     if not cam.isOpened():
         print("❌ Cannot open camera!")
         return
     
-    cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    cam.set(cv2.CAP_PROP_FPS, 30)
-    
-    face_cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    )
+    detector = create_face_detector()
+    if detector is not None:
+        print("✅ Using YuNet DNN face detector")
     
     students_captured = start_from
     
+    # rollNo -> student_id, kept in sync as students are added
+    rollno_to_sid = {
+        info['rollNo']: sid for sid, info in db.items() if 'rollNo' in info
+    }
+    
+    # Face images are JPEG-encoded on a thread pool (OpenCV releases the GIL)
+    # and written to disk in order by a single writer thread
+    encode_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+    write_q = queue.Queue(maxsize=16)
+    writer_thread = threading.Thread(target=image_writer, args=(write_q,), daemon=True)
+    writer_thread.start()
+    
     try:
         for student_num in range(start_from + 1, total_students + 1):
             print("\n" + "=" * 70)
@@ -142,11 +271,9 @@ def bulk_capture_class():
                 student_id = f"{student_id}_{student_num}"
             
             # Check duplicate roll number
-            for sid, info in db.items():
-                if info.get('rollNo') == roll_no and sid != student_id:
-                    print(f"⚠️  Roll {roll_no} exists! Adding suffix...")
-                    roll_no = f"{roll_no}_{student_num}"
-                    break
+            if roll_no in rollno_to_sid and rollno_to_sid[roll_no] != student_id:
+                print(f"⚠️  Roll {roll_no} exists! Adding suffix...")
+                roll_no = f"{roll_no}_{student_num}"
             
             print(f"\n✅ Capturing: {name} ({roll_no})")
             print("⏱️  Get ready... Starting in 3 seconds...")
@@ -170,24 +297,28 @@ def bulk_capture_class():
                     print("❌ Camera error!")
                     break
                 
-                frame = cv2.flip(frame, 1)
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                # No full-frame mirror flip; only saved crops are flipped (below)
+                # so they stay mirrored like face_capture's and existing datasets.
+                # The full-frame grayscale image is only needed by the Haar
+                # cascade; YuNet takes BGR.
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if detector is None else None
                 
-                faces = face_cascade.detectMultiScale(
-                    gray, 
-                    scaleFactor=1.2, 
-                    minNeighbors=5,
-                    minSize=(120, 120)
-                )
+                faces = detect_faces(frame, gray, detector, face_cascade)
                 
                 for (x, y, w, h) in faces:
                     detect_counter += 1
                     
                     if detect_counter % frame_skip == 0 and saved_count < required_images:
-                        face = gray[y:y+h, x:x+w]
+                        if gray is not None:
+                            face = gray[y:y+h, x:x+w]
+                        else:
+                            # Convert just the face region
+                            face = cv2.cvtColor(frame[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
+                        # Mirror the crop (a new array, safe to hand to the encoder)
+                        face = cv2.flip(face, 1)
                         saved_count += 1
                         filename = f"{dataset_path}/{saved_count}.jpg"
-                        cv2.imwrite(filename, face)
+                        write_q.put((filename, encode_pool.submit(encode_jpeg, face)))
                         
                         cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 3)
                         cv2.putText(frame, "✓ CAPTURED!", (x, y-10),
@@ -197,9 +328,9 @@ def bulk_capture_class():
                 
                 # Progress bar
                 progress = (saved_count / required_images) * 100
-                cv2.rectangle(frame, (50, 20), (590, 50), (50, 50, 50), -1)
-                cv2.rectangle(frame, (50, 20), (50 + int(540 * saved_count / required_images), 50), 
-                             (0, 255, 0), -1)
+                # Solid fills via NumPy slicing; the border still uses cv2.rectangle
+                frame[20:51, 50:591] = (50, 50, 50)
+                frame[20:51, 50:51 + int(540 * saved_count / required_images)] = (0, 255, 0)
                 cv2.rectangle(frame, (50, 20), (590, 50), (255, 255, 255), 2)
                 
                 cv2.putText(frame, f"{saved_count}/{required_images} ({progress:.0f}%)", 
@@ -221,6 +352,9 @@ def bulk_capture_class():
                             break
                     break
             
+            # Make sure every image for this student is on disk
+            write_q.join()
+            
             if saved_count >= 30:  # Minimum 30 images required
                 # Save to database
                 db[student_id] = {
@@ -232,7 +366,8 @@ def bulk_capture_class():
                     "registeredDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                     "datasetPath": dataset_path
                 }
-                save_student_database(db)
+                append_student_journal(student_id, db[student_id])
+                rollno_to_sid[roll_no] = student_id
                 students_captured += 1
                 print(f"✅ Saved: {name} ({saved_count} images)")
             else:
@@ -252,7 +387,16 @@ def bulk_capture_class():
         import traceback
         traceback.print_exc()
     finally:
-        cam.release()
+        # Flush pending images and stop the writer thread
+        write_q.put(None)
+        writer_thread.join()
+        encode_pool.shutdown(wait=True)
+        
+        # Single full database write for the whole session
+        if students_captured > start_from:
+            compact_student_database(db)
+        
+        # Camera stays open for the next session; released at exit
         cv2.destroyAllWindows()
         
         print("\n" + "=" * 70)
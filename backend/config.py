@@ -5,6 +5,9 @@ Centralized configuration for the entire system
 
 import os
 
+# Set once create_directories() has run in this process
+_DIRS_READY = False
+
 class Config:
     """System Configuration"""
     
@@ -19,6 +22,7 @@ class Config:
     STUDENT_DB = os.path.join(BASE_DIR, "student_database.json")
     ATTENDANCE_CSV = os.path.join(BASE_DIR, "attendance.csv")
     TRAINER_MODEL = os.path.join(TRAINER_PATH, "trainer.yml")
+    LABEL_CACHE = os.path.join(TRAINER_PATH, "labels.pkl")  # label_map from train_model.py
     
     # ==================== ACADEMICS ====================
     ALLOWED_BRANCHES = ["CSE", "AIML", "ECE", "EEE", "MECH", "CIVIL"]
@@ -28,14 +32,36 @@ class Config:
     # Confidence threshold (lower = stricter, higher = more lenient)
     RECOGNITION_CONFIDENCE_THRESHOLD = 75
     
+    # Optional SFace embedding recognizer (LBPH is used if the model is missing).
+    # train_model.py writes one mean embedding per student to FACE_EMBEDDINGS.
+    SFACE_MODEL = os.path.join(BASE_DIR, "face_recognition_sface_2021dec.onnx")
+    FACE_EMBEDDINGS = os.path.join(TRAINER_PATH, "embeddings.npz")
+    SFACE_MATCH_THRESHOLD = 0.363  # Cosine similarity (higher = same person)
+    
+    # A recognized face overlapping its previous box by at least this IoU keeps its label
+    TRACKING_IOU_THRESHOLD = 0.6
+    
     # Face detection parameters
     FACE_DETECTION_SCALE_FACTOR = 1.2
     FACE_DETECTION_MIN_NEIGHBORS = 5
     FACE_DETECTION_MIN_SIZE = (100, 100)
+    # Cascade detection (capture and recognition) runs on a frame shrunk by this factor
+    FACE_DETECTION_DOWNSCALE = 2
+    # Offload recognition-time detection to the GPU via OpenCL when available
+    USE_OPENCL = True
+    
+    # Optional YuNet DNN detector (Haar cascade is used if the model is missing)
+    YUNET_MODEL = os.path.join(BASE_DIR, "face_detection_yunet_2023mar.onnx")
+    YUNET_SCORE_THRESHOLD = 0.7
+    
+    # LBP cascade for live recognition (falls back to the Haar cascade if missing).
+    # pip builds of OpenCV ship only haarcascades; copy the XML from opencv/data/lbpcascades.
+    LBP_CASCADE = os.path.join(BASE_DIR, "lbpcascade_frontalface_improved.xml")
     
     # Image capture settings
     REQUIRED_IMAGES_PER_STUDENT = 50
     IMAGE_CAPTURE_FRAME_SKIP = 2  # Capture every 2nd detected face
+    FACE_IMAGE_QUALITY = 85  # JPEG quality for saved face crops (OpenCV default: 95)
     
     # ==================== ATTENDANCE ====================
     # Cooldown to prevent multiple marks (seconds)
@@ -51,8 +77,8 @@ class Config:
     CAMERA_FPS = 30
     CAMERA_BUFFER_SIZE = 1
     
-    # Display FPS (for recognition window)
-    DISPLAY_TARGET_FPS = 20
+    # Mirror the recognition window like a selfie view (display only; detection uses the raw frame)
+    MIRROR_DISPLAY = True
     
     # ==================== VALIDATION ====================
     # Roll number format: BRANCH + SECTION + 3 digits
@@ -67,7 +93,7 @@ class Config:
     # ==================== BACKUP ====================
     AUTO_BACKUP_ENABLED = True
     BACKUP_ON_STUDENT_ADD = True
-    MAX_BACKUP_FILES = 10  # Keep last 10 backups
+    MAX_BACKUP_FILES = 10  # Keep last 10 backups of each kind (database, attendance)
     
     # ==================== LOGGING ====================
     LOG_LEVEL = "INFO"
@@ -78,6 +104,7 @@ class Config:
     API_HOST = "0.0.0.0"
     API_PORT = 5000
     API_DEBUG = True
+    API_THREADS = 8  # waitress worker threads (used when API_DEBUG is False)
     
     # ==================== DEMO CREDENTIALS ====================
     # WARNING: Change these in production!
@@ -89,6 +116,10 @@ class Config:
     @classmethod
     def create_directories(cls):
         """Create necessary directories if they don't exist"""
+        global _DIRS_READY
+        if _DIRS_READY:
+            return
+        
         directories = [
             cls.DATASET_PATH,
             cls.TRAINER_PATH,
@@ -97,9 +128,14 @@ class Config:
         ]
         
         for directory in directories:
-            if not os.path.exists(directory):
+            # Let mkdir report EEXIST instead of stat-ing first
+            try:
                 os.makedirs(directory)
                 print(f"✅ Created directory: {directory}")
+            except FileExistsError:
+                pass
+        
+        _DIRS_READY = True
     
     @classmethod
     def validate_branch_section(cls, branch, section):
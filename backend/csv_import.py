@@ -1,25 +1,31 @@
 import csv
-import json
+import gc
 import os
+from collections import Counter
 from datetime import datetime
+from operator import itemgetter
+from json_utils import json_loads, json_dumps
 
 STUDENT_DB = "student_database.json"
 
+# Large buffer for roster CSV reads/writes (fewer syscalls on big files)
+CSV_BUFFER_SIZE = 1 << 20
+
 def load_student_database():
     if os.path.exists(STUDENT_DB):
-        with open(STUDENT_DB, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(STUDENT_DB, 'rb') as f:
+            return json_loads(f.read())
     return {}
 
 def save_student_database(db):
-    with open(STUDENT_DB, 'w', encoding='utf-8') as f:
-        json.dump(db, indent=4, fp=f)
+    with open(STUDENT_DB, 'wb') as f:
+        f.write(json_dumps(db))
 
 def create_sample_csv():
     """Create a sample CSV template"""
     filename = "student_import_template.csv"
     
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
+    with open(filename, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as f:
         writer = csv.writer(f)
         writer.writerow(['Name', 'RollNo', 'Branch', 'Section'])
         writer.writerow(['John Doe', 'AIML001', 'AIML', 'A'])
@@ -59,80 +65,110 @@ def import_students_from_csv():
     errors = []
     
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        with open(csv_file, 'r', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as f:
+            reader = csv.reader(f)
+            headers = next(reader, [])
             
             # Validate headers
             required_headers = ['Name', 'RollNo', 'Branch', 'Section']
-            if not all(header in reader.fieldnames for header in required_headers):
+            if not all(header in headers for header in required_headers):
                 print(f"❌ CSV must have headers: {', '.join(required_headers)}")
-                print(f"   Found: {', '.join(reader.fieldnames)}")
+                print(f"   Found: {', '.join(headers)}")
                 return
             
+            # Column positions, resolved once
+            name_idx = headers.index('Name')
+            roll_idx = headers.index('RollNo')
+            branch_idx = headers.index('Branch')
+            section_idx = headers.index('Section')
+            last_idx = max(name_idx, roll_idx, branch_idx, section_idx)
+            
             print("\n📝 Processing students...")
             
-            for row_num, row in enumerate(reader, start=2):
-                name = row.get('Name', '').strip()
-                roll_no = row.get('RollNo', '').strip()
-                branch = row.get('Branch', '').strip().upper()
-                section = row.get('Section', '').strip().upper()
-                
-                # Validate data
-                if not name or not roll_no or not branch or not section:
-                    errors.append(f"Row {row_num}: Missing required fields")
-                    skipped += 1
-                    continue
-                
-                # Validate branch and section
-                valid_branches = ['CSE', 'AIML', 'ECE', 'EEE', 'MECH', 'CIVIL']
-                valid_sections = ['A', 'B']
-                
-                if branch not in valid_branches:
-                    errors.append(f"Row {row_num}: Invalid branch '{branch}'")
-                    skipped += 1
-                    continue
-                
-                if section not in valid_sections:
-                    errors.append(f"Row {row_num}: Invalid section '{section}'")
-                    skipped += 1
-                    continue
-                
-                # Check for duplicate roll number
-                duplicate = False
-                for student_id, info in db.items():
-                    if info.get('rollNo') == roll_no:
+            # Roll numbers already taken (updated as rows are imported)
+            existing_rolls = {info.get('rollNo') for info in db.values()}
+            
+            # Highest numeric suffix used per base student ID ("name_3" -> 3)
+            id_counts = Counter()
+            for existing_id in db:
+                base, _, suffix = existing_id.rpartition('_')
+                if base and suffix.isdigit():
+                    id_counts[base] = max(id_counts[base], int(suffix))
+            
+            # Many small dicts are created below; pause cyclic GC meanwhile
+            gc.disable()
+            try:
+                for row_num, row in enumerate(reader, start=2):
+                    # Blank lines are ignored (as DictReader did)
+                    if not row:
+                        continue
+                    
+                    # Short rows are missing required fields
+                    if len(row) <= last_idx:
+                        errors.append(f"Row {row_num}: Missing required fields")
+                        skipped += 1
+                        continue
+                    
+                    name = row[name_idx].strip()
+                    roll_no = row[roll_idx].strip()
+                    branch = row[branch_idx].strip().upper()
+                    section = row[section_idx].strip().upper()
+                    
+                    # Validate data
+                    if not name or not roll_no or not branch or not section:
+                        errors.append(f"Row {row_num}: Missing required fields")
+                        skipped += 1
+                        continue
+                    
+                    # Validate branch and section
+                    valid_branches = ['CSE', 'AIML', 'ECE', 'EEE', 'MECH', 'CIVIL']
+                    valid_sections = ['A', 'B']
+                    
+                    if branch not in valid_branches:
+                        errors.append(f"Row {row_num}: Invalid branch '{branch}'")
+                        skipped += 1
+                        continue
+                    
+                    if section not in valid_sections:
+                        errors.append(f"Row {row_num}: Invalid section '{section}'")
+                        skipped += 1
+                        continue
+                    
+                    # Check for duplicate roll number
+                    if roll_no in existing_rolls:
                         errors.append(f"Row {row_num}: Duplicate roll number '{roll_no}'")
                         skipped += 1
-                        duplicate = True
-                        break
-                
-                if duplicate:
-                    continue
-                
-                # Create student ID
-                student_id = name.lower().replace(" ", "_")
-                
-                # Handle duplicate names
-                if student_id in db:
-                    counter = 1
-                    while f"{student_id}_{counter}" in db:
-                        counter += 1
-                    student_id = f"{student_id}_{counter}"
-                
-                # Add to database
-                db[student_id] = {
-                    "name": name,
-                    "rollNo": roll_no,
-                    "branch": branch,
-                    "section": section,
-                    "imagesCount": 0,  # No images yet - need to capture
-                    "registeredDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "datasetPath": "",
-                    "imported": True
-                }
-                
-                imported += 1
-                print(f"   ✅ {name} ({roll_no}) - {branch}-{section}")
+                        continue
+                    
+                    # Create student ID
+                    student_id = name.lower().replace(" ", "_")
+                    
+                    # Handle duplicate names
+                    if student_id in db:
+                        counter = id_counts[student_id] + 1
+                        while f"{student_id}_{counter}" in db:
+                            counter += 1
+                        id_counts[student_id] = counter
+                        student_id = f"{student_id}_{counter}"
+                    
+                    # Add to database
+                    db[student_id] = {
+                        "name": name,
+                        "rollNo": roll_no,
+                        "branch": branch,
+                        "section": section,
+                        "imagesCount": 0,  # No images yet - need to capture
+                        "registeredDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "datasetPath": "",
+                        "imported": True
+                    }
+                    existing_rolls.add(roll_no)
+                    
+                    imported += 1
+                    if imported % 100 == 0:
+                        print(f"   ... {imported} imported", flush=True)
+            finally:
+                gc.enable()
         
         # Save database
         save_student_database(db)
@@ -176,19 +212,24 @@ def export_database_to_csv():
     
     filename = f"student_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
+    with open(filename, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as f:
         writer = csv.writer(f)
         writer.writerow(['Name', 'RollNo', 'Branch', 'Section', 'Images', 'Registered'])
         
-        for student_id, info in sorted(db.items(), key=lambda x: x[1].get('rollNo', '')):
-            writer.writerow([
+        rows = [
+            (
                 info['name'],
                 info['rollNo'],
                 info['branch'],
                 info['section'],
                 info.get('imagesCount', 0),
                 info.get('registeredDate', 'N/A')
-            ])
+            )
+            for info in db.values()
+        ]
+        rows.sort(key=itemgetter(1))
+        
+        writer.writerows(rows)
     
     print(f"✅ Database exported to: {filename}")
 
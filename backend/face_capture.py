@@ -4,10 +4,101 @@ With comprehensive validation and duplicate prevention
 """
 
 import cv2
+import numpy as np
 import os
+import sys
 import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 from validators import validate_and_add_student, StudentValidator, ValidationError
+from face_detection import create_face_detector, detect_faces_yunet
+
+# Bound once so the per-frame capture loop avoids repeated attribute lookups
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+draw_rectangle = cv2.rectangle
+put_text = cv2.putText
+
+# Haar cascade XML is parsed once per process, not once per capture
+FACE_CASCADE_PATH = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+_FACE_CASCADE = cv2.CascadeClassifier(FACE_CASCADE_PATH)
+
+# Crops whose average hash is this close to the last saved one are skipped
+DUPLICATE_HASH_DISTANCE = 4
+
+
+def face_hash(face):
+    """64-bit average hash of a grayscale face crop (8x8 mean threshold)"""
+    small = cv2.resize(face, (8, 8), interpolation=cv2.INTER_AREA)
+    return int(np.packbits(small > small.mean()).view('<u8')[0])
+
+
+def write_image(filename, image, params):
+    """Encode to JPEG in memory, then write the bytes (runs on the writer thread)"""
+    ok, buffer = cv2.imencode(".jpg", image, params)
+    if not ok:
+        print(f"\n⚠️ Could not encode {filename}")
+        return False
+    Path(filename).write_bytes(buffer)
+    return True
+
+
+def open_camera():
+    """Open the camera with an explicit backend, small buffer and MJPEG"""
+    if sys.platform == 'win32':
+        backend = cv2.CAP_MSMF
+    elif sys.platform == 'darwin':
+        backend = cv2.CAP_AVFOUNDATION
+    else:
+        backend = cv2.CAP_V4L2
+    
+    cam = cv2.VideoCapture(Config.CAMERA_INDEX, backend)
+    if not cam.isOpened():
+        # Fall back to whatever backend OpenCV picks
+        cam = cv2.VideoCapture(Config.CAMERA_INDEX)
+    
+    if cam.isOpened():
+        # MJPEG lets most webcams deliver 640x480 at full frame rate
+        cam.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cam.set(cv2.CAP_PROP_FRAME_WIDTH, Config.CAMERA_WIDTH)
+        cam.set(cv2.CAP_PROP_FRAME_HEIGHT, Config.CAMERA_HEIGHT)
+        cam.set(cv2.CAP_PROP_FPS, Config.CAMERA_FPS)
+        cam.set(cv2.CAP_PROP_BUFFERSIZE, Config.CAMERA_BUFFER_SIZE)
+    
+    return cam
+
+
+def build_static_overlay(frame_shape, lines, bar_rect):
+    """
+    Pre-render the parts of the capture HUD that never change.
+    
+    Args:
+        frame_shape: Shape of the camera frame
+        lines: [(text, (x, y))] student info lines
+        bar_rect: (x, y, width, height) of the progress bar
+    
+    Returns:
+        (overlay, mask): BGR overlay image and boolean mask of drawn pixels
+    """
+    overlay = np.zeros(frame_shape, dtype=np.uint8)
+    mask = np.zeros(frame_shape[:2], dtype=np.uint8)
+    bar_x, bar_y, bar_width, bar_height = bar_rect
+    
+    for target, value in ((overlay, (50, 50, 50)), (mask, 255)):
+        # Progress bar background
+        cv2.rectangle(target, (bar_x-5, bar_y-5), (bar_x+bar_width+5, bar_y+bar_height+5),
+                      value, -1)
+    
+    for target, value in ((overlay, (255, 255, 255)), (mask, 255)):
+        # Progress bar border
+        cv2.rectangle(target, (bar_x, bar_y), (bar_x+bar_width, bar_y+bar_height),
+                      value, 2)
+        
+        # Student info
+        for text, origin in lines:
+            cv2.putText(target, text, origin, FONT, 0.6, value, 2)
+    
+    return overlay, mask.astype(bool)[:, :, np.newaxis]
 
 
 def get_student_info():
@@ -115,31 +206,54 @@ def capture_student_faces():
     
     # Initialize camera
     print("\n📷 Opening camera...")
-    cam = cv2.VideoCapture(Config.CAMERA_INDEX)
+    cam = open_camera()
     
     if not cam.isOpened():
         print("❌ Cannot open camera!")
         return
     
-    # Set camera properties
-    cam.set(cv2.CAP_PROP_FRAME_WIDTH, Config.CAMERA_WIDTH)
-    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, Config.CAMERA_HEIGHT)
-    cam.set(cv2.CAP_PROP_FPS, Config.CAMERA_FPS)
-    
-    # Load face cascade
-    face_cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    )
+    # Face cascade (loaded at import)
+    face_cascade = _FACE_CASCADE
     
     if face_cascade.empty():
         print("❌ Error loading face cascade!")
         cam.release()
         return
     
+    # Prefer YuNet when its model is available
+    detector = create_face_detector()
+    if detector is not None:
+        print("✅ Using YuNet DNN face detector")
+    
     required_images = Config.REQUIRED_IMAGES_PER_STUDENT
     saved_count = 0
     frame_skip = Config.IMAGE_CAPTURE_FRAME_SKIP
     detect_counter = 0
+    last_hash = None
+    
+    # Detection settings hoisted out of the frame loop
+    scale_factor = Config.FACE_DETECTION_SCALE_FACTOR
+    min_neighbors = Config.FACE_DETECTION_MIN_NEIGHBORS
+    min_size = Config.FACE_DETECTION_MIN_SIZE
+    downscale = Config.FACE_DETECTION_DOWNSCALE
+    small_min_size = (min_size[0] // downscale, min_size[1] // downscale)
+    jpeg_params = [
+        cv2.IMWRITE_JPEG_QUALITY, Config.FACE_IMAGE_QUALITY,
+        cv2.IMWRITE_JPEG_OPTIMIZE, 1
+    ]
+    
+    # Progress bar geometry and static HUD (rendered on the first frame)
+    bar_width = 400
+    bar_height = 30
+    bar_x = 120
+    bar_y = 20
+    info_lines = [
+        (f"Student: {name}", (10, 70)),
+        (f"Roll No: {roll_no}", (10, 95)),
+        (f"Class: {branch}-{section}", (10, 120))
+    ]
+    static_overlay = None
+    static_mask = None
     
     print("\n" + "=" * 70)
     print(f"👤 Student: {name}")
@@ -160,107 +274,121 @@ def capture_student_faces():
     time.sleep(3)
     
     try:
-        while saved_count < required_images:
-            ret, frame = cam.read()
-            if not ret:
-                print("\n❌ Error reading from camera")
-                break
-            
-            # Flip frame for mirror effect
-            frame = cv2.flip(frame, 1)
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Detect faces
-            faces = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=Config.FACE_DETECTION_SCALE_FACTOR,
-                minNeighbors=Config.FACE_DETECTION_MIN_NEIGHBORS,
-                minSize=Config.FACE_DETECTION_MIN_SIZE
-            )
-            
-            # Process faces
-            face_detected = False
-            for (x, y, w, h) in faces:
-                face_detected = True
-                detect_counter += 1
+        # Single background writer; leaving the block waits for pending images
+        with ThreadPoolExecutor(max_workers=1) as write_pool:
+            while saved_count < required_images:
+                ret, frame = cam.read()
+                if not ret:
+                    print("\n❌ Error reading from camera")
+                    break
                 
-                # Only save every Nth detection for variety
-                if detect_counter % frame_skip == 0 and saved_count < required_images:
-                    face = gray[y:y+h, x:x+w]
-                    
-                    # Save face image
-                    saved_count += 1
-                    filename = f"{dataset_path}/{saved_count}.jpg"
-                    cv2.imwrite(filename, face)
+                # Flip frame for mirror effect
+                frame = cv2.flip(frame, 1)
+                
+                # Detect faces
+                if detector is not None:
+                    # YuNet works on BGR directly; only saved crops are converted
+                    gray = None
+                    faces = detect_faces_yunet(detector, frame, min_size)
+                else:
+                    # Convert to grayscale; detect on a shrunken copy and
+                    # scale boxes back up so crops stay full resolution
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    small = cv2.resize(gray, (0, 0), fx=1 / downscale, fy=1 / downscale,
+                                       interpolation=cv2.INTER_AREA)
+                    faces = [
+                        (x * downscale, y * downscale, w * downscale, h * downscale)
+                        for (x, y, w, h) in face_cascade.detectMultiScale(
+                            small,
+                            scaleFactor=scale_factor,
+                            minNeighbors=min_neighbors,
+                            minSize=small_min_size
+                        )
+                    ]
+                
+                # Process faces
+                face_detected = False
+                for (x, y, w, h) in faces:
+                    face_detected = True
+                    detect_counter += 1
                     
-                    # Green box for captured
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 3)
-                    cv2.putText(frame, "✓ CAPTURED!", (x, y-10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+                    # Only save every Nth detection for variety
+                    if detect_counter % frame_skip == 0 and saved_count < required_images:
+                        if gray is not None:
+                            face = gray[y:y+h, x:x+w]
+                        else:
+                            face = cv2.cvtColor(frame[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
+                        
+                        # Skip near-identical crops while the subject holds still
+                        h_face = face_hash(face)
+                        if (last_hash is not None and
+                                (h_face ^ last_hash).bit_count() <= DUPLICATE_HASH_DISTANCE):
+                            draw_rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
+                            continue
+                        last_hash = h_face
+                        
+                        # Save face image
+                        saved_count += 1
+                        filename = f"{dataset_path}/{saved_count}.jpg"
+                        # Encode/write off the capture loop. gray and frame are new
+                        # arrays every iteration, so the crop stays valid.
+                        write_pool.submit(write_image, filename, face, jpeg_params)
+                        
+                        # Green box for captured
+                        draw_rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 3)
+                        put_text(frame, "✓ CAPTURED!", (x, y-10),
+                                 FONT, 0.8, (0, 255, 0), 2)
+                    else:
+                        # Yellow box while waiting
+                        draw_rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
+                
+                # Static HUD: bar background/border and student info
+                if static_overlay is None or static_overlay.shape != frame.shape:
+                    static_overlay, static_mask = build_static_overlay(
+                        frame.shape, info_lines, (bar_x, bar_y, bar_width, bar_height)
+                    )
+                np.copyto(frame, static_overlay, where=static_mask)
+                
+                # Show progress bar
+                progress = (saved_count / required_images) * 100
+                
+                # Progress bar
+                progress_width = int((saved_count / required_images) * bar_width)
+                # Solid axis-aligned fill: plain NumPy slice assignment, kept inside
+                # the pre-rendered 2px border (which spans +/-1px around the bar edge)
+                fill_right = bar_x + min(progress_width, bar_width - 2) + 1
+                frame[bar_y+2:bar_y+bar_height-1, bar_x+2:fill_right] = (0, 255, 0)
+                
+                # Text
+                progress_text = f"{saved_count}/{required_images} ({progress:.0f}%)"
+                put_text(frame, progress_text, (bar_x+bar_width//2-80, bar_y+22),
+                         FONT, 0.7, (255, 255, 255), 2)
+                
+                # Instructions
+                if not face_detected:
+                    put_text(frame, "⚠ NO FACE DETECTED - Please face the camera",
+                             (10, frame.shape[0] - 20), FONT,
+                             0.6, (0, 0, 255), 2)
                 else:
-                    # Yellow box while waiting
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
-            
-            # Show progress bar
-            progress = (saved_count / required_images) * 100
-            bar_width = 400
-            bar_height = 30
-            bar_x = 120
-            bar_y = 20
-            
-            # Background
-            cv2.rectangle(frame, (bar_x-5, bar_y-5), (bar_x+bar_width+5, bar_y+bar_height+5),
-                         (50, 50, 50), -1)
-            
-            # Progress bar
-            progress_width = int((saved_count / required_images) * bar_width)
-            cv2.rectangle(frame, (bar_x, bar_y), (bar_x+progress_width, bar_y+bar_height),
-                         (0, 255, 0), -1)
-            
-            # Border
-            cv2.rectangle(frame, (bar_x, bar_y), (bar_x+bar_width, bar_y+bar_height),
-                         (255, 255, 255), 2)
-            
-            # Text
-            progress_text = f"{saved_count}/{required_images} ({progress:.0f}%)"
-            cv2.putText(frame, progress_text, (bar_x+bar_width//2-80, bar_y+22),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            
-            # Student info
-            cv2.putText(frame, f"Student: {name}", (10, 70),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-            cv2.putText(frame, f"Roll No: {roll_no}", (10, 95),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-            cv2.putText(frame, f"Class: {branch}-{section}", (10, 120),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-            
-            # Instructions
-            if not face_detected:
-                cv2.putText(frame, "⚠ NO FACE DETECTED - Please face the camera",
-                           (10, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX,
-                           0.6, (0, 0, 255), 2)
-            else:
-                cv2.putText(frame, "✓ Face detected - Keep moving slightly",
-                           (10, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX,
-                           0.6, (0, 255, 0), 2)
-            
-            cv2.imshow("Face Capture - Press Q to Quit", frame)
-            
-            # Exit on 'q'
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q') or key == ord('Q'):
-                if saved_count < required_images:
-                    print(f"\n⚠️ Only {saved_count} images captured (need {required_images})")
-                    print("   This may affect recognition accuracy!")
-                    cont = input("   Continue anyway? (yes/no): ").strip().lower()
-                    if cont != 'yes':
-                        print("❌ Capture cancelled")
-                        cam.release()
-                        cv2.destroyAllWindows()
-                        return
-                break
+                    put_text(frame, "✓ Face detected - Keep moving slightly",
+                             (10, frame.shape[0] - 20), FONT,
+                             0.6, (0, 255, 0), 2)
+                
+                cv2.imshow("Face Capture - Press Q to Quit", frame)
+                
+                # Exit on 'q'
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q') or key == ord('Q'):
+                    if saved_count < required_images:
+                        print(f"\n⚠️ Only {saved_count} images captured (need {required_images})")
+                        print("   This may affect recognition accuracy!")
+                        cont = input("   Continue anyway? (yes/no): ").strip().lower()
+                        if cont != 'yes':
+                            print("❌ Capture cancelled")
+                            cam.release()
+                            cv2.destroyAllWindows()
+                            return
+                    break
         
         cam.release()
         cv2.destroyAllWindows()
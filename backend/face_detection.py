@@ -0,0 +1,41 @@
+"""
+Smart Attendance System - Face Detection
+YuNet DNN face detector shared by the capture scripts
+"""
+
+import cv2
+import os
+from config import Config
+
+
+def create_face_detector(width=Config.CAMERA_WIDTH, height=Config.CAMERA_HEIGHT):
+    """Create the YuNet DNN face detector, or None if it's not available"""
+    if not hasattr(cv2, "FaceDetectorYN") or not os.path.exists(Config.YUNET_MODEL):
+        return None
+    try:
+        return cv2.FaceDetectorYN.create(
+            Config.YUNET_MODEL, "",
+            (width, height),
+            score_threshold=Config.YUNET_SCORE_THRESHOLD
+        )
+    except cv2.error as e:
+        print(f"⚠️ Could not load YuNet model: {e}")
+        return None
+
+
+def detect_faces_yunet(detector, frame, min_size):
+    """Run YuNet on a BGR frame and return (x, y, w, h) boxes inside the frame"""
+    frame_h, frame_w = frame.shape[:2]
+    detector.setInputSize((frame_w, frame_h))
+    _, detections = detector.detect(frame)
+    if detections is None:
+        return []
+    
+    faces = []
+    for x, y, w, h in detections[:, :4].astype(int):
+        # YuNet boxes may extend past the frame edge
+        x, y = max(0, x), max(0, y)
+        w, h = min(w, frame_w - x), min(h, frame_h - y)
+        if w >= min_size[0] and h >= min_size[1]:
+            faces.append((x, y, w, h))
+    return faces
@@ -0,0 +1,18 @@
+"""
+Smart Attendance System - JSON Helpers
+Fast (de)serialization of the student database files
+"""
+
+import json
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    def json_dumps(obj):
+        """Serialize to indented UTF-8 JSON bytes"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:  # orjson is optional; stdlib json is the fallback
+    json_loads = json.loads
+    def json_dumps(obj):
+        """Serialize to indented UTF-8 JSON bytes"""
+        return json.dumps(obj, indent=4).encode('utf-8')
@@ -5,14 +5,46 @@ Fixed camera with accurate attendance tracking
 
 import cv2
 import csv
+import numpy as np
 import os
+import pickle
 import sys
 import json
-import time
+import queue
+import threading
 from datetime import datetime
 from collections import deque
 from config import Config
 
+# Optional Numba JIT for the per-frame status helper
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit"""
+        def decorate(func):
+            return func
+        return decorate
+
+# SFace expects 112x112 face crops
+SFACE_INPUT_SIZE = (112, 112)
+
+# Some SFace ONNX exports have a fixed batch of 1; cleared on the first
+# failed batched forward so later calls go straight to one crop per pass
+_sface_batching = {"ok": True}
+
+# Per-face status codes
+STATUS_UNKNOWN = 0
+STATUS_CORRECT_CLASS = 1
+STATUS_WRONG_CLASS = 2
+STATUS_COLORS = (
+    (0, 0, 255),    # Red: unknown
+    (0, 255, 0),    # Green: correct class
+    (0, 165, 255)   # Orange: wrong class
+)
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
 
 def load_student_database():
     """Load student database"""
@@ -25,338 +57,666 @@ def load_student_database():
     return {}
 
 
-def batch_write_attendance(queue, filename):
-    """Write attendance records in batch"""
+def scan_label_map():
+    """Map label ids to dataset folder names (sorted, same order as train_model.py)"""
+    # scandir's is_dir() comes from the directory listing, no extra stat per entry
+    with os.scandir(Config.DATASET_PATH) as entries:
+        person_names = sorted(entry.name for entry in entries if entry.is_dir())
+    
+    return dict(enumerate(person_names))
+
+
+def build_name_to_info(label_map, student_db):
+    """Find each labelled student's database record (by id, then by name)"""
+    # Case-insensitive name index, keeping the first record per name
+    by_name = {}
+    for info in student_db.values():
+        by_name.setdefault(info.get('name', '').lower(), info)
+    
+    name_to_info = {}
+    for person_name in label_map.values():
+        student_id = person_name.lower().replace(" ", "_")
+        if student_id in student_db:
+            name_to_info[person_name] = student_db[student_id]
+        elif person_name.lower() in by_name:
+            name_to_info[person_name] = by_name[person_name.lower()]
+        else:
+            name_to_info[person_name] = {
+                'rollNo': 'N/A',
+                'branch': 'UNKNOWN',
+                'section': 'UNKNOWN'
+            }
+    
+    return name_to_info
+
+
+def load_label_info(student_db):
+    """
+    Load label_map, preferring the cache written by train_model.py, and
+    match each label to the current student database.
+    
+    label_map belongs to trainer.yml, so the cache is used whenever it is at
+    least as new as the model; otherwise the dataset folder is scanned.
+    name_to_info is always rebuilt so database edits show up immediately.
+    
+    Returns:
+        tuple: (label_map, name_to_info, from_cache)
+    """
+    label_map = None
+    try:
+        if os.path.getmtime(Config.LABEL_CACHE) >= os.path.getmtime(Config.TRAINER_MODEL):
+            with open(Config.LABEL_CACHE, 'rb') as f:
+                label_map = pickle.load(f)['label_map']
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+        pass
+    
+    from_cache = label_map is not None
+    if not from_cache:
+        label_map = scan_label_map()
+    return label_map, build_name_to_info(label_map, student_db), from_cache
+
+
+def save_label_cache(label_map):
+    """Write the label cache atomically (temp file + rename)"""
+    temp_file = Config.LABEL_CACHE + ".tmp"
+    with open(temp_file, 'wb') as f:
+        pickle.dump({'label_map': label_map}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file, Config.LABEL_CACHE)
+
+
+def batch_write_attendance(queue, writer, fh):
+    """Write attendance records in batch to the session's open CSV handle"""
     if not queue:
         return
     
     try:
-        with open(filename, "a", newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            while queue:
-                writer.writerow(queue.popleft())
+        # popleft (not list + clear) so rows appended by the worker meanwhile are kept
+        rows = []
+        while queue:
+            rows.append(queue.popleft())
+        writer.writerows(rows)
+        fh.flush()
     except Exception as e:
         print(f"❌ Error writing attendance: {e}")
 
 
-print("=" * 70)
-print("🎯 Smart Attendance System - Face Recognition")
-print("=" * 70)
+def load_face_cascade():
+    """Load the LBP face cascade, falling back to the Haar cascade"""
+    candidates = [
+        Config.LBP_CASCADE,
+        cv2.data.haarcascades + "lbpcascade_frontalface_improved.xml",
+        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+    ]
+    
+    for path in candidates:
+        if not os.path.exists(path):
+            continue
+        cascade = cv2.CascadeClassifier(path)
+        if not cascade.empty():
+            return cascade, os.path.basename(path)
+    
+    return None, None
+
+
+@njit(cache=True)
+def classify_faces(labels, label_in_class):
+    """Status code per face from int32 labels (-1 = unrecognized)"""
+    statuses = np.zeros(labels.shape[0], np.uint8)
+    for i in range(labels.shape[0]):
+        label = labels[i]
+        if label < 0 or label >= label_in_class.shape[0]:
+            statuses[i] = STATUS_UNKNOWN
+        elif label_in_class[label]:
+            statuses[i] = STATUS_CORRECT_CLASS
+        else:
+            statuses[i] = STATUS_WRONG_CLASS
+    return statuses
+
+
+def render_label(text, scale, color, thickness):
+    """
+    Rasterize a text label once, as cv2.putText would draw it.
+    Returns (bitmap, mask, dx, dy): the bitmap's top-left corner sits at
+    (x - dx, y - dy) for a putText origin of (x, y).
+    """
+    (text_w, text_h), baseline = cv2.getTextSize(text, FONT, scale, thickness)
+    pad = thickness
+    bitmap = np.zeros((text_h + baseline + 2 * pad, text_w + 2 * pad, 3), np.uint8)
+    cv2.putText(bitmap, text, (pad, pad + text_h), FONT, scale, color, thickness)
+    return bitmap, bitmap.any(axis=2), pad, pad + text_h
+
+
+def blit_label(frame, label, x, y):
+    """Copy a pre-rendered label onto frame at putText origin (x, y), clipped to the frame"""
+    bitmap, mask, dx, dy = label
+    left, top = x - dx, y - dy
+    x0, y0 = max(left, 0), max(top, 0)
+    x1 = min(left + bitmap.shape[1], frame.shape[1])
+    y1 = min(top + bitmap.shape[0], frame.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return
+    
+    src = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+    np.copyto(frame[y0:y1, x0:x1], bitmap[src], where=mask[src][..., None])
 
-# Get branch and section from command line
-if len(sys.argv) < 3:
-    print("❌ Error: Branch and Section arguments required")
-    print("Usage: python recognize_attendance.py <BRANCH> <SECTION>")
-    sys.exit(1)
 
-branch = sys.argv[1].upper()
-section = sys.argv[2].upper()
+def match_previous_boxes(bboxes, prev_bboxes, threshold):
+    """Index of the best-overlapping previous box for each box (-1 if IoU < threshold)"""
+    if len(bboxes) == 0 or len(prev_bboxes) == 0:
+        return np.full(len(bboxes), -1, np.intp)
+    
+    a = bboxes[:, None, :].astype(np.float32)
+    b = prev_bboxes[None, :, :].astype(np.float32)
+    ix = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    iy = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    inter = np.clip(ix, 0, None) * np.clip(iy, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    iou = inter / np.maximum(union, 1.0)
+    
+    best = iou.argmax(axis=1)
+    best[iou[np.arange(len(bboxes)), best] < threshold] = -1
+    return best
+
+
+def embed_faces(net, crops):
+    """
+    Embed grayscale face crops with one batched SFace forward pass,
+    falling back to one forward per crop if the model rejects the batch.
+    """
+    blob = cv2.dnn.blobFromImages(
+        [cv2.cvtColor(cv2.resize(crop, SFACE_INPUT_SIZE), cv2.COLOR_GRAY2BGR) for crop in crops],
+        1.0, SFACE_INPUT_SIZE, (0, 0, 0), swapRB=False, crop=False
+    )
+    
+    feats = None
+    if len(crops) > 1 and _sface_batching["ok"]:
+        try:
+            net.setInput(blob)
+            out = net.forward()
+            if out.shape[0] == len(crops):
+                feats = out.reshape(len(crops), -1)
+        except cv2.error:
+            pass
+        if feats is None:
+            print("⚠️ SFace model does not accept batches, embedding one face at a time")
+            _sface_batching["ok"] = False
+    
+    if feats is None:
+        rows = []
+        for i in range(len(crops)):
+            net.setInput(blob[i:i+1])
+            rows.append(net.forward().reshape(1, -1))
+        feats = np.vstack(rows)
+    
+    norms = np.linalg.norm(feats, axis=1, keepdims=True)
+    return feats / np.maximum(norms, 1e-12)
+
 
-print(f"✅ Branch: {branch}")
-print(f"✅ Section: {section}")
+def load_embedding_matcher():
+    """Load SFace and the per-student embeddings written by train_model.py"""
+    if not (os.path.exists(Config.SFACE_MODEL) and os.path.exists(Config.FACE_EMBEDDINGS)):
+        return None
+    
+    # Embeddings older than trainer.yml describe a previous dataset
+    if os.path.getmtime(Config.FACE_EMBEDDINGS) < os.path.getmtime(Config.TRAINER_MODEL):
+        print("⚠️ SFace embeddings are older than the trained model, using LBPH")
+        return None
+    
+    try:
+        net = cv2.dnn.readNetFromONNX(Config.SFACE_MODEL)
+        data = np.load(Config.FACE_EMBEDDINGS)
+        names = [str(name) for name in data['names']]
+        return net, data['embeddings'], names
+    except Exception as e:
+        print(f"⚠️ Could not load SFace embeddings, using LBPH: {e}")
+        return None
 
-# Load student database
-student_db = load_student_database()
-print(f"✅ Loaded database with {len(student_db)} students")
 
-# Load trained recognizer
-recognizer = cv2.face.LBPHFaceRecognizer_create()
+def match_faces(matcher, crops):
+    """Return (name or None, similarity) per crop using one matrix product"""
+    net, known, names = matcher
+    scores = embed_faces(net, crops) @ known.T
+    best = scores.argmax(axis=1)
+    
+    matches = []
+    for i, j in enumerate(best):
+        score = float(scores[i, j])
+        matches.append((names[j] if score >= Config.SFACE_MATCH_THRESHOLD else None, score))
+    return matches
 
-if not os.path.exists(Config.TRAINER_MODEL):
-    print(f"❌ Error: {Config.TRAINER_MODEL} not found. Please train the model first.")
-    sys.exit(1)
 
-try:
-    recognizer.read(Config.TRAINER_MODEL)
-    print("✅ Model loaded successfully")
-except Exception as e:
-    print(f"❌ Error loading model: {e}")
-    sys.exit(1)
-
-# Load face cascade
-face_cascade = cv2.CascadeClassifier(
-    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-)
+def run(branch, section, stop_evt=None):
+    """
+    Run the attendance recognition loop for one class.
+    
+    Args:
+        branch: Branch code (e.g. CSE)
+        section: Section letter (e.g. A)
+        stop_evt: Optional threading.Event; the loop exits once it is set
+    
+    Returns:
+        bool: False if setup failed, True once the session ends
+    """
+    branch = branch.upper()
+    section = section.upper()
+    
+    print("=" * 70)
+    print("🎯 Smart Attendance System - Face Recognition")
+    print("=" * 70)
 
-if face_cascade.empty():
-    print("❌ Error: Could not load face cascade")
-    sys.exit(1)
+    print(f"✅ Branch: {branch}")
+    print(f"✅ Section: {section}")
 
-print("✅ Face cascade loaded")
+    # Load student database
+    student_db = load_student_database()
+    print(f"✅ Loaded database with {len(student_db)} students")
 
-# Load label mapping and student info
-label_map = {}
-name_to_info = {}
-label_id = 0
+    # Load trained recognizer
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
 
-if not os.path.exists(Config.DATASET_PATH):
-    print(f"❌ Error: {Config.DATASET_PATH} folder not found")
-    sys.exit(1)
+    if not os.path.exists(Config.TRAINER_MODEL):
+        print(f"❌ Error: {Config.TRAINER_MODEL} not found. Please train the model first.")
+        return False
 
-for person_name in os.listdir(Config.DATASET_PATH):
-    person_folder = os.path.join(Config.DATASET_PATH, person_name)
-    if os.path.isdir(person_folder):
-        label_map[label_id] = person_name
-        
-        # Find student info in database
-        student_id = person_name.lower().replace(" ", "_")
-        if student_id in student_db:
-            name_to_info[person_name] = student_db[student_id]
+    try:
+        recognizer.read(Config.TRAINER_MODEL)
+        print("✅ Model loaded successfully")
+    except Exception as e:
+        print(f"❌ Error loading model: {e}")
+        return False
+
+    # Batched SFace matching replaces per-face LBPH predict when available
+    matcher = load_embedding_matcher()
+    if matcher is not None:
+        print(f"✅ SFace embeddings loaded ({len(matcher[2])} students)")
+
+    # Load face cascade (LBP is integer-only and much faster than Haar)
+    face_cascade, cascade_name = load_face_cascade()
+
+    if face_cascade is None:
+        print("❌ Error: Could not load face cascade")
+        return False
+
+    print(f"✅ Face cascade loaded ({cascade_name})")
+
+    # Load label mapping and student info
+    if not os.path.exists(Config.DATASET_PATH):
+        print(f"❌ Error: {Config.DATASET_PATH} folder not found")
+        return False
+
+    label_map, name_to_info, from_cache = load_label_info(student_db)
+    if from_cache:
+        print("✅ Label map loaded from cache")
+
+    print(f"✅ Loaded {len(label_map)} students from dataset")
+
+    # Filter students for this class
+    class_students = {
+        name: info for name, info in name_to_info.items()
+        if info.get('branch') == branch and info.get('section') == section
+    }
+
+    if not class_students:
+        print(f"⚠️ WARNING: No students found for {branch}-{section} in dataset!")
+        print("   Students will be marked but shown as 'Wrong Class'")
+    else:
+        print(f"✅ {len(class_students)} students belong to {branch}-{section}")
+
+    # Flat per-label lookups (labels are 0..N-1) so the per-face path never
+    # touches name_to_info or compares branch/section strings
+    label_ids = {name: lid for lid, name in label_map.items()}
+    label_names = tuple(label_map[lid] for lid in range(len(label_map)))
+    label_infos = [name_to_info.get(name, {}) for name in label_names]
+    label_to_rollno = tuple(info.get('rollNo', 'N/A') for info in label_infos)
+    label_classes = tuple(
+        f"{info.get('branch', 'UNKNOWN')}-{info.get('section', 'UNKNOWN')}"
+        for info in label_infos
+    )
+    correct_class_labels = frozenset(
+        lid for lid, name in enumerate(label_names) if name in class_students
+    )
+    label_in_class = np.array(
+        [lid in correct_class_labels for lid in range(len(label_names))],
+        dtype=np.bool_
+    )
+
+    # Text labels rendered once per student, then blitted every frame
+    label_bitmaps = []
+    for lid, name in enumerate(label_names):
+        if lid in correct_class_labels:
+            color = STATUS_COLORS[STATUS_CORRECT_CLASS]
+            label_bitmaps.append((
+                render_label(name, 0.8, color, 2),
+                render_label(label_to_rollno[lid], 0.6, color, 2)
+            ))
         else:
-            # Search by name (case insensitive)
-            found = False
-            for sid, info in student_db.items():
-                if info.get('name', '').lower() == person_name.lower():
-                    name_to_info[person_name] = info
-                    found = True
-                    break
-            
-            if not found:
-                name_to_info[person_name] = {
-                    'rollNo': 'N/A',
-                    'branch': 'UNKNOWN',
-                    'section': 'UNKNOWN'
-                }
-        
-        label_id += 1
-
-print(f"✅ Loaded {len(label_map)} students from dataset")
-
-# Filter students for this class
-class_students = {
-    name: info for name, info in name_to_info.items()
-    if info.get('branch') == branch and info.get('section') == section
-}
-
-if not class_students:
-    print(f"⚠️ WARNING: No students found for {branch}-{section} in dataset!")
-    print("   Students will be marked but shown as 'Wrong Class'")
-else:
-    print(f"✅ {len(class_students)} students belong to {branch}-{section}")
-
-# Initialize attendance file
-if not os.path.exists(Config.ATTENDANCE_CSV):
-    with open(Config.ATTENDANCE_CSV, "w", newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Name", "RollNo", "Branch", "Section", "Date", "Time"])
-    print("✅ Created new attendance.csv file")
-
-# Tracking variables
-marked_names = set()
-recognition_cooldown = {}
-attendance_queue = deque()
-
-# Start camera
-print("🎥 Opening camera...")
-cam = cv2.VideoCapture(Config.CAMERA_INDEX)
-
-if not cam.isOpened():
-    print("❌ Error: Cannot open camera")
-    sys.exit(1)
-
-# Set camera properties for stable feed
-cam.set(cv2.CAP_PROP_FRAME_WIDTH, Config.CAMERA_WIDTH)
-cam.set(cv2.CAP_PROP_FRAME_HEIGHT, Config.CAMERA_HEIGHT)
-cam.set(cv2.CAP_PROP_FPS, Config.CAMERA_FPS)
-cam.set(cv2.CAP_PROP_BUFFERSIZE, Config.CAMERA_BUFFER_SIZE)
-
-print(f"✅ Camera opened successfully")
-print(f"📸 Starting attendance for {branch}-{section}")
-print("=" * 70)
-print("💡 INSTRUCTIONS:")
-print("  • Students should look at the camera")
-print("  • Green box = Recognized and marked")
-print("  • Orange box = Wrong class")
-print("  • Red box = Unknown face")
-print("  • Press 'Q' to stop")
-print("=" * 70)
-
-# FPS control
-target_fps = Config.DISPLAY_TARGET_FPS
-frame_time = 1.0 / target_fps
-last_frame_time = time.time()
-
-# Process every Nth frame
-process_every_n_frames = 2
-frame_count = 0
-
-# Store last detection results
-last_detection_results = []
+            color = STATUS_COLORS[STATUS_WRONG_CLASS]
+            label_bitmaps.append((
+                render_label(f"{name} - Wrong Class!", 0.7, color, 2),
+                render_label(f"Should be: {label_classes[lid]}", 0.5, color, 1)
+            ))
+    marked_bitmap = render_label("MARKED", 0.6, STATUS_COLORS[STATUS_CORRECT_CLASS], 2)
+    unknown_bitmap = render_label("Unknown", 0.9, STATUS_COLORS[STATUS_UNKNOWN], 2)
+    quit_bitmap = render_label("Press Q to Stop", 0.6, (255, 255, 255), 2)
+
+    # Initialize attendance file
+    if not os.path.exists(Config.ATTENDANCE_CSV):
+        with open(Config.ATTENDANCE_CSV, "w", newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Name", "RollNo", "Branch", "Section", "Date", "Time"])
+        print("✅ Created new attendance.csv file")
+
+    # Tracking variables
+    marked_names = set()
+    attendance_queue = deque()
+
+    # Stopped during setup: don't grab the camera at all
+    if stop_evt is not None and stop_evt.is_set():
+        print("\n⏹️ Stopped by API request before the camera opened")
+        return True
+
+    # Start camera
+    print("🎥 Opening camera...")
+    cam = cv2.VideoCapture(Config.CAMERA_INDEX)
+
+    if not cam.isOpened():
+        print("❌ Error: Cannot open camera")
+        return False
+
+    # Set camera properties for stable feed
+    cam.set(cv2.CAP_PROP_FRAME_WIDTH, Config.CAMERA_WIDTH)
+    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, Config.CAMERA_HEIGHT)
+    cam.set(cv2.CAP_PROP_FPS, Config.CAMERA_FPS)
+    cam.set(cv2.CAP_PROP_BUFFERSIZE, Config.CAMERA_BUFFER_SIZE)
+
+    print(f"✅ Camera opened successfully")
+    print(f"📸 Starting attendance for {branch}-{section}")
+    print("=" * 70)
+    print("💡 INSTRUCTIONS:")
+    print("  • Students should look at the camera")
+    print("  • Green box = Recognized and marked")
+    print("  • Orange box = Wrong class")
+    print("  • Red box = Unknown face")
+    print("  • Press 'Q' to stop")
+    print("=" * 70)
+
+    frame_count = 0
+
+    # Latest detection results as parallel arrays (bboxes, labels, statuses),
+    # published by the worker thread
+    last_detection_results = (
+        np.empty((0, 4), np.int32), np.empty(0, np.int32), np.empty(0, np.uint8)
+    )
+    results_lock = threading.Lock()
+
+    # Single-slot hand-off: the worker always gets the newest frame
+    frame_slot = queue.Queue(maxsize=1)
+    worker_stop = threading.Event()
+
+    # Detection runs on a shrunken gray frame; boxes are scaled back up
+    # so the recognizer still sees full-resolution crops
+    scale_factor = Config.FACE_DETECTION_SCALE_FACTOR
+    min_neighbors = Config.FACE_DETECTION_MIN_NEIGHBORS
+    downscale = Config.FACE_DETECTION_DOWNSCALE
+    small_min_size = (Config.FACE_DETECTION_MIN_SIZE[0] // downscale,
+                      Config.FACE_DETECTION_MIN_SIZE[1] // downscale)
+    tracking_iou = Config.TRACKING_IOU_THRESHOLD
+
+    # Run resize + cascade through OpenCL (T-API) when a device is available
+    cv2.ocl.setUseOpenCL(Config.USE_OPENCL)
+    use_umat = cv2.ocl.useOpenCL()
+    if use_umat:
+        print("✅ OpenCL enabled for face detection")
+
+    def detect_loop():
+        """Detect, recognize and mark faces off the display loop"""
+        nonlocal last_detection_results
+
+        # Boxes and labels from the previous pass, for IoU label reuse
+        prev_bboxes = np.empty((0, 4), np.int32)
+        prev_labels = np.empty(0, np.int32)
+
+        while not worker_stop.is_set():
+            try:
+                gray = frame_slot.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            current_time = datetime.now()
+
+            # The gray frame stays on the host for recognizer crops; only the
+            # detection input is uploaded (boxes come back as a NumPy array)
+            src = cv2.UMat(gray) if use_umat else gray
+            small = cv2.resize(src, (0, 0), fx=1 / downscale, fy=1 / downscale,
+                               interpolation=cv2.INTER_AREA)
+            faces = [
+                (x * downscale, y * downscale, w * downscale, h * downscale)
+                for (x, y, w, h) in face_cascade.detectMultiScale(
+                    small,
+                    scaleFactor=scale_factor,
+                    minNeighbors=min_neighbors,
+                    minSize=small_min_size
+                )
+            ]
+
+            # Identify every face into parallel arrays. Label -1 = unrecognized.
+            n_faces = len(faces)
+            bboxes = np.array(faces, np.int32).reshape(n_faces, 4)
+            labels = np.full(n_faces, -1, np.int32)
+            keep = np.ones(n_faces, np.bool_)
+
+            # A recognized face that barely moved keeps its label; only new
+            # or still-unknown boxes go through the recognizer
+            prev = match_previous_boxes(bboxes, prev_bboxes, tracking_iou)
+            reused = prev >= 0
+            labels[reused] = prev_labels[prev[reused]]
+            pending = np.flatnonzero(labels < 0).tolist()
+
+            # One batched SFace pass, or LBPH per crop. Detection ran on the
+            # raw frame, but training crops are mirrored (face_capture and
+            # bulk_capture save selfie-view crops), so each crop is flipped
+            # to match before recognition.
+            if matcher is not None:
+                if pending:
+                    crops = [cv2.flip(gray[y:y+h, x:x+w], 1) for (x, y, w, h) in bboxes[pending].tolist()]
+                    for i, (name, _) in zip(pending, match_faces(matcher, crops)):
+                        labels[i] = label_ids.get(name, -1)
+            else:
+                for i in pending:
+                    x, y, w, h = bboxes[i].tolist()
+                    face_img = cv2.flip(gray[y:y+h, x:x+w], 1)
+
+                    try:
+                        label, confidence = recognizer.predict(face_img)
+                    except:
+                        keep[i] = False
+                        continue
+
+                    if confidence < Config.RECOGNITION_CONFIDENCE_THRESHOLD:
+                        labels[i] = label
+
+            bboxes, labels = bboxes[keep], labels[keep]
+            prev_bboxes, prev_labels = bboxes, labels
+            statuses = classify_faces(labels, label_in_class)
+
+            # Mark students of this class the first time they are seen (once per session)
+            date_str = time_str = None
+            for label in labels[statuses == STATUS_CORRECT_CLASS].tolist():
+                name = label_names[label]
+                if name in marked_names:
+                    continue
 
-try:
-    while True:
-        ret, frame = cam.read()
-        if not ret:
-            print("❌ Error: Cannot read from camera")
-            break
-
-        frame_count += 1
-        
-        # Flip for mirror effect
-        frame = cv2.flip(frame, 1)
-        
-        current_time = datetime.now()
-        
-        # Process face detection only every N frames
-        should_process = (frame_count % process_every_n_frames == 0)
-        
-        if should_process:
+                # Format the pass timestamp once, on its first new mark
+                if date_str is None:
+                    date_str = current_time.strftime("%Y-%m-%d")
+                    time_str = current_time.strftime("%H:%M:%S")
+
+                roll_no = label_to_rollno[label]
+
+                # Add to queue (deque appends are thread-safe)
+                attendance_queue.append([name, roll_no, branch, section, date_str, time_str])
+
+                marked_names.add(name)
+
+                print(f"✅ MARKED: {name} ({roll_no}) | {branch}-{section} | {time_str}")
+
+            # Publish results for the display loop
+            with results_lock:
+                last_detection_results = (bboxes, labels, statuses)
+
+    def detect_worker():
+        """Run detect_loop, reporting any error; the display loop ends once this thread exits"""
+        try:
+            detect_loop()
+        except Exception as e:
+            print(f"\n❌ Error in detection worker: {e}")
+            import traceback
+            traceback.print_exc()
+
+    # One buffered append handle for the whole session, flushed per batch
+    attendance_fh = open(Config.ATTENDANCE_CSV, "a", newline='', encoding='utf-8', buffering=65536)
+    attendance_writer = csv.writer(attendance_fh)
+
+    worker = threading.Thread(target=detect_worker, name="detect-worker", daemon=True)
+    worker.start()
+
+    mirror_display = Config.MIRROR_DISPLAY
+    display = None
+
+    try:
+        while True:
+            ret, frame = cam.read()
+            if not ret:
+                print("❌ Error: Cannot read from camera")
+                break
+
+            # Stop requested by the API (in-process run)
+            if stop_evt is not None and stop_evt.is_set():
+                print("\n⏹️ Stopping by API request...")
+                break
+
+            # Detection worker died (its error was already reported)
+            if not worker.is_alive():
+                print("❌ Error: Detection worker stopped, ending session")
+                break
+
+            frame_count += 1
+
+            # Hand a private gray copy to the worker (the display frame gets
+            # drawn on below), replacing any frame it has not picked up yet
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=Config.FACE_DETECTION_SCALE_FACTOR,
-                minNeighbors=Config.FACE_DETECTION_MIN_NEIGHBORS,
-                minSize=Config.FACE_DETECTION_MIN_SIZE
-            )
-            
-            # Store results for next frames
-            last_detection_results = []
-            
-            for (x, y, w, h) in faces:
-                face_img = gray[y:y+h, x:x+w]
-                
+            try:
+                frame_slot.put_nowait(gray)
+            except queue.Full:
                 try:
-                    label, confidence = recognizer.predict(face_img)
-                except:
-                    continue
+                    frame_slot.get_nowait()
+                except queue.Empty:
+                    pass
+                frame_slot.put_nowait(gray)
+
+            with results_lock:
+                detection_results = last_detection_results
+
+            # Detection runs on the raw frame; only the shown image is mirrored
+            # (into a reused buffer) and boxes are mirrored arithmetically
+            if mirror_display:
+                display = cv2.flip(frame, 1, dst=display)
+            else:
+                display = frame
+            frame_width = frame.shape[1]
+
+            # Draw ALL detections on EVERY frame
+            bboxes, labels, statuses = detection_results
+            for (x, y, w, h), label, status in zip(bboxes.tolist(), labels.tolist(), statuses.tolist()):
+                color = STATUS_COLORS[status]
+                if mirror_display:
+                    x = frame_width - x - w
+
+                # Draw rectangle
+                cv2.rectangle(display, (x, y), (x+w, y+h), color, 3 if status == STATUS_CORRECT_CLASS else 2)
+
+                # Draw labels (correct-class faces are marked as soon as they are seen)
+                if status == STATUS_CORRECT_CLASS:
+                    name_label, roll_label = label_bitmaps[label]
+                    blit_label(display, name_label, x, y-30)
+                    blit_label(display, roll_label, x, y-10)
+                    blit_label(display, marked_bitmap, x+w-100, y+20)
+
+                elif status == STATUS_WRONG_CLASS:
+                    wrong_label, should_label = label_bitmaps[label]
+                    blit_label(display, wrong_label, x, y-10)
+                    blit_label(display, should_label, x, y+h+20)
+
+                else:  # Unknown
+                    blit_label(display, unknown_bitmap, x, y-10)
+
+            # Display info
+            cv2.putText(display, f"Class: {branch}-{section} | Present: {len(marked_names)}",
+                       (10, 30), FONT, 0.7, (255, 255, 255), 2)
+            blit_label(display, quit_bitmap, 10, display.shape[0] - 20)
+
+            # Show frame
+            cv2.imshow(f"Smart Attendance - {branch}-{section}", display)
+
+            # cam.read() already paces the loop at the camera's CAP_PROP_FPS
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q') or key == ord('Q'):
+                print("\n⏹️ Stopping by user request...")
+                break
+
+            # Batch write every N frames
+            if frame_count % Config.BATCH_WRITE_INTERVAL == 0 and attendance_queue:
+                batch_write_attendance(attendance_queue, attendance_writer, attendance_fh)
+
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopped by user (Ctrl+C)")
+    except Exception as e:
+        print(f"\n❌ Error during recognition: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        # Stop the detection worker before the last flush
+        worker_stop.set()
+        worker.join(timeout=2)
+
+        # Final batch write
+        if attendance_queue:
+            batch_write_attendance(attendance_queue, attendance_writer, attendance_fh)
+        attendance_fh.close()
+
+        # Release resources
+        cam.release()
+        cv2.destroyAllWindows()
+
+    print("\n" + "=" * 70)
+    print("✅ ATTENDANCE SESSION COMPLETED")
+    print("=" * 70)
+    print(f"📊 Class: {branch}-{section}")
+    print(f"👥 Total Present: {len(marked_names)}")
+
+    if marked_names:
+        print("\n📋 Students Present:")
+        for i, name in enumerate(sorted(marked_names), 1):
+            info = name_to_info.get(name, {})
+            roll = info.get('rollNo', 'N/A')
+            print(f"   {i}. {name} ({roll})")
+    else:
+        print("\n⚠️ No students marked present")
+
+    print("=" * 70)
+    print(f"💾 Attendance saved to: {Config.ATTENDANCE_CSV}")
+    print("=" * 70)
+    
+    return True
+
 
-                result = {
-                    'bbox': (x, y, w, h),
-                    'name': 'Unknown',
-                    'roll_no': '',
-                    'color': (0, 0, 255),  # Red
-                    'status': 'unknown',
-                    'confidence': confidence
-                }
-
-                if confidence < Config.RECOGNITION_CONFIDENCE_THRESHOLD:
-                    name = label_map.get(label, "Unknown")
-                    student_info = name_to_info.get(name, {})
-                    roll_no = student_info.get('rollNo', 'N/A')
-                    student_branch = student_info.get('branch', 'UNKNOWN')
-                    student_section = student_info.get('section', 'UNKNOWN')
-                    
-                    result['name'] = name
-                    result['roll_no'] = roll_no
-                    
-                    # Check if student belongs to this class
-                    if student_branch == branch and student_section == section:
-                        result['color'] = (0, 255, 0)  # Green
-                        result['status'] = 'correct_class'
-                        
-                        # Check cooldown
-                        last_mark_time = recognition_cooldown.get(name)
-                        time_since_last_mark = 999
-                        if last_mark_time:
-                            time_since_last_mark = (current_time - last_mark_time).total_seconds()
-                        
-                        # Mark attendance (once per session or after cooldown)
-                        if name not in marked_names:
-                            now = datetime.now()
-                            date_str = now.strftime("%Y-%m-%d")
-                            time_str = now.strftime("%H:%M:%S")
-                            
-                            # Add to queue
-                            attendance_queue.append([name, roll_no, branch, section, date_str, time_str])
-                            
-                            marked_names.add(name)
-                            recognition_cooldown[name] = current_time
-                            
-                            print(f"✅ MARKED: {name} ({roll_no}) | {branch}-{section} | {time_str}")
-                        
-                        result['marked'] = (name in marked_names)
-                    else:
-                        result['color'] = (0, 165, 255)  # Orange
-                        result['status'] = 'wrong_class'
-                        result['correct_class'] = f"{student_branch}-{student_section}"
-                
-                last_detection_results.append(result)
-        
-        # Draw ALL detections on EVERY frame
-        for result in last_detection_results:
-            x, y, w, h = result['bbox']
-            name = result['name']
-            color = result['color']
-            status = result['status']
-            
-            # Draw rectangle
-            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 3 if status == 'correct_class' else 2)
-            
-            # Draw labels
-            if status == 'correct_class':
-                cv2.putText(frame, name, (x, y-30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-                cv2.putText(frame, result['roll_no'], (x, y-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                
-                if result.get('marked'):
-                    cv2.putText(frame, "MARKED", (x+w-100, y+20),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-            
-            elif status == 'wrong_class':
-                cv2.putText(frame, f"{name} - Wrong Class!", (x, y-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                cv2.putText(frame, f"Should be: {result.get('correct_class', '')}", (x, y+h+20),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-            
-            else:  # Unknown
-                cv2.putText(frame, "Unknown", (x, y-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-
-        # Display info
-        cv2.putText(frame, f"Class: {branch}-{section} | Present: {len(marked_names)}",
-                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(frame, "Press Q to Stop", (10, frame.shape[0] - 20),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-
-        # Show frame
-        cv2.imshow(f"Smart Attendance - {branch}-{section}", frame)
-
-        # FPS control
-        elapsed = time.time() - last_frame_time
-        wait_time = max(1, int((frame_time - elapsed) * 1000))
-        
-        key = cv2.waitKey(wait_time) & 0xFF
-        if key == ord('q') or key == ord('Q'):
-            print("\n⏹️ Stopping by user request...")
-            break
-        
-        last_frame_time = time.time()
-        
-        # Batch write every N frames
-        if frame_count % Config.BATCH_WRITE_INTERVAL == 0 and attendance_queue:
-            batch_write_attendance(attendance_queue, Config.ATTENDANCE_CSV)
-
-except KeyboardInterrupt:
-    print("\n⏹️ Stopped by user (Ctrl+C)")
-except Exception as e:
-    print(f"\n❌ Error during recognition: {e}")
-    import traceback
-    traceback.print_exc()
-finally:
-    # Final batch write
-    if attendance_queue:
-        batch_write_attendance(attendance_queue, Config.ATTENDANCE_CSV)
+if __name__ == "__main__":
+    # Get branch and section from command line
+    if len(sys.argv) < 3:
+        print("❌ Error: Branch and Section arguments required")
+        print("Usage: python recognize_attendance.py <BRANCH> <SECTION>")
+        sys.exit(1)
     
-    # Release resources
-    cam.release()
-    cv2.destroyAllWindows()
-
-print("\n" + "=" * 70)
-print("✅ ATTENDANCE SESSION COMPLETED")
-print("=" * 70)
-print(f"📊 Class: {branch}-{section}")
-print(f"👥 Total Present: {len(marked_names)}")
-
-if marked_names:
-    print("\n📋 Students Present:")
-    for i, name in enumerate(sorted(marked_names), 1):
-        info = name_to_info.get(name, {})
-        roll = info.get('rollNo', 'N/A')
-        print(f"   {i}. {name} ({roll})")
-else:
-    print("\n⚠️ No students marked present")
-
-print("=" * 70)
-print(f"💾 Attendance saved to: {Config.ATTENDANCE_CSV}")
-print("=" * 70)
\ No newline at end of file
+    if not run(sys.argv[1], sys.argv[2]):
+        sys.exit(1)
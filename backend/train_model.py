@@ -6,7 +6,9 @@ Train face recognition model from captured images
 import cv2
 import numpy as np
 import os
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
+from recognize_attendance import embed_faces, save_label_cache
 
 print("=" * 70)
 print("🔄 SMART ATTENDANCE - MODEL TRAINING")
@@ -33,13 +35,16 @@ print("-" * 70)
 
 total_images = 0
 students_with_insufficient_images = []
+image_paths = []
+path_labels = []
 
-# Load all student images
-for person_name in sorted(os.listdir(Config.DATASET_PATH)):
-    person_folder = os.path.join(Config.DATASET_PATH, person_name)
+# Load all student images (scandir: is_dir() needs no extra stat per entry)
+with os.scandir(Config.DATASET_PATH) as entries:
+    person_dirs = sorted((entry for entry in entries if entry.is_dir()), key=lambda e: e.name)
 
-    if not os.path.isdir(person_folder):
-        continue
+for entry in person_dirs:
+    person_name = entry.name
+    person_folder = entry.path
 
     label_map[label_id] = person_name
     
@@ -53,21 +58,28 @@ for person_name in sorted(os.listdir(Config.DATASET_PATH)):
     else:
         print(f"✅ {person_name}: {image_count} images")
 
-    # Load images
+    # Queue images; they are decoded in parallel below
     for image_name in image_files:
-        image_path = os.path.join(person_folder, image_name)
+        image_paths.append(os.path.join(person_folder, image_name))
+        path_labels.append(label_id)
 
-        gray_img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    label_id += 1
+
+# Decode all images in parallel (OpenCV releases the GIL while decoding)
+def load_gray(image_path):
+    """Read one face image as grayscale"""
+    return cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+
+with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+    for image_path, lid, gray_img in zip(image_paths, path_labels, pool.map(load_gray, image_paths)):
         if gray_img is None:
-            print(f"   ⚠️ Could not load: {image_name}")
+            print(f"   ⚠️ Could not load: {os.path.basename(image_path)}")
             continue
 
         faces.append(gray_img)
-        labels.append(label_id)
+        labels.append(lid)
         total_images += 1
 
-    label_id += 1
-
 print("-" * 70)
 
 # Check if enough data
@@ -109,6 +121,32 @@ try:
     print("✅ MODEL TRAINED SUCCESSFULLY!")
     print("=" * 70)
     print(f"💾 Model saved to: {Config.TRAINER_MODEL}")
+    
+    # Cache labels so recognition can skip the dataset scan
+    save_label_cache(label_map)
+    print(f"💾 Label cache saved to: {Config.LABEL_CACHE}")
+    
+    # Optional SFace embeddings: one normalized mean vector per student
+    if os.path.exists(Config.SFACE_MODEL):
+        net = cv2.dnn.readNetFromONNX(Config.SFACE_MODEL)
+        labels_arr = np.array(labels)
+        embedding_names = []
+        embeddings = []
+        for lid, name in sorted(label_map.items()):
+            idx = np.flatnonzero(labels_arr == lid)
+            if len(idx) == 0:
+                continue
+            mean = embed_faces(net, [faces[i] for i in idx]).mean(axis=0)
+            embeddings.append(mean / max(np.linalg.norm(mean), 1e-12))
+            embedding_names.append(name)
+        
+        np.savez(Config.FACE_EMBEDDINGS,
+                 embeddings=np.array(embeddings, dtype=np.float32),
+                 names=np.array(embedding_names))
+        print(f"💾 SFace embeddings saved to: {Config.FACE_EMBEDDINGS}")
+    elif os.path.exists(Config.FACE_EMBEDDINGS):
+        # Embeddings from an earlier training no longer match this model
+        os.remove(Config.FACE_EMBEDDINGS)
     print(f"👥 Trained on {len(label_map)} students")
     print(f"📸 Using {total_images} face images")
     
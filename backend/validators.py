@@ -4,9 +4,80 @@ Comprehensive validation and duplicate prevention
 """
 
 import re
-import json
 import os
+from contextlib import contextmanager
 from config import Config
+from json_utils import json_loads, json_dumps
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Validation patterns, compiled once at import
+_NAME_RE = re.compile(r"^[A-Za-z\s.\-']+$")
+_ROLL_RE = re.compile(r"^[A-Z0-9]+$")
+_ID_SANITIZE_RE = re.compile(r'[^a-z0-9_]')
+
+# Parsed database, reused while the file's mtime/size are unchanged.
+# "entry" is a (key, db) tuple replaced in one assignment, so concurrent
+# API threads never see a new key paired with an old (or missing) db.
+_db_cache = {"entry": (None, None)}
+
+# Duplicate-check indexes for the most recently indexed database dict,
+# stored as one (db, rolls, names) tuple for the same reason
+_index_cache = {"entry": (None, None, None)}
+
+
+def _duplicate_indexes(db):
+    """
+    Roll number and (name, branch, section) -> [student_id, ...] indexes.
+    Rebuilt only when a different database dict is passed in; callers
+    copy the database before modifying it, so an indexed dict never changes.
+    """
+    indexed_db, rolls, names = _index_cache["entry"]
+    if indexed_db is not db:
+        rolls = {}
+        names = {}
+        for student_id, info in db.items():
+            rolls.setdefault(info.get('rollNo', '').upper(), []).append(student_id)
+            name_key = (
+                info.get('name', '').lower().strip(),
+                info.get('branch', '').upper(),
+                info.get('section', '').upper()
+            )
+            names.setdefault(name_key, []).append(student_id)
+        
+        _index_cache["entry"] = (db, rolls, names)
+    
+    return rolls, names
+
+
+def save_database(db):
+    """Save student database atomically (temp file + rename)"""
+    tmp_file = Config.STUDENT_DB + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(json_dumps(db))
+    os.replace(tmp_file, Config.STUDENT_DB)
+
+
+@contextmanager
+def _db_lock():
+    """
+    Exclusive lock serializing read-modify-write of the student database
+    across processes. Uses a sidecar lock file because saves replace the
+    database file itself. No-op where fcntl is unavailable (Windows).
+    """
+    if fcntl is None:
+        yield
+        return
+    
+    with open(Config.STUDENT_DB + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 class ValidationError(Exception):
@@ -20,13 +91,24 @@ class StudentValidator:
     @staticmethod
     def load_database():
         """Load student database"""
-        if os.path.exists(Config.STUDENT_DB):
-            try:
-                with open(Config.STUDENT_DB, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        try:
+            st = os.stat(Config.STUDENT_DB)
+        except OSError:
+            return {}
+        
+        key = (st.st_mtime_ns, st.st_size)
+        cached_key, cached_db = _db_cache["entry"]
+        if cached_key == key:
+            return cached_db
+        
+        try:
+            with open(Config.STUDENT_DB, 'rb') as f:
+                db = json_loads(f.read())
+        except:
+            return {}
+        
+        _db_cache["entry"] = (key, db)
+        return db
     
     @staticmethod
     def validate_name(name):
@@ -49,7 +131,7 @@ class StudentValidator:
             raise ValidationError(f"Name must be at most {Config.NAME_MAX_LENGTH} characters")
         
         # Allow letters, spaces, dots, hyphens, apostrophes
-        if not re.match(r"^[A-Za-z\s.\-']+$", name):
+        if not _NAME_RE.match(name):
             raise ValidationError("Name can only contain letters, spaces, dots, hyphens, and apostrophes")
         
         return name
@@ -75,7 +157,7 @@ class StudentValidator:
             raise ValidationError(f"Roll number must be at most {Config.ROLL_NUMBER_MAX_LENGTH} characters")
         
         # Must be alphanumeric
-        if not re.match(r"^[A-Z0-9]+$", roll_no):
+        if not _ROLL_RE.match(roll_no):
             raise ValidationError("Roll number can only contain uppercase letters and numbers")
         
         # Optional: Check if it follows recommended pattern
@@ -98,39 +180,42 @@ class StudentValidator:
         return branch.upper(), section.upper()
     
     @staticmethod
-    def check_duplicate_roll_number(roll_no, exclude_student_id=None):
+    def check_duplicate_roll_number(roll_no, exclude_student_id=None, db=None):
         """
         Check if roll number already exists
         
         Args:
             roll_no: Roll number to check
             exclude_student_id: Student ID to exclude from check (for updates)
+            db: Already-loaded database (loaded here if None)
         
         Returns:
             (bool, str): (is_duplicate, error_message)
         """
-        db = StudentValidator.load_database()
+        if db is None:
+            db = StudentValidator.load_database()
+        rolls, _ = _duplicate_indexes(db)
         
-        for student_id, info in db.items():
+        for student_id in rolls.get(roll_no.upper(), ()):
             # Skip if this is the student being updated
             if exclude_student_id and student_id == exclude_student_id:
                 continue
             
-            if info.get('rollNo', '').upper() == roll_no.upper():
-                existing_name = info.get('name', 'Unknown')
-                existing_class = f"{info.get('branch', 'N/A')}-{info.get('section', 'N/A')}"
-                
-                error_msg = (
-                    f"❌ DUPLICATE ROLL NUMBER!\n"
-                    f"   Roll number '{roll_no}' already exists.\n"
-                    f"   Belongs to: {existing_name} ({existing_class})"
-                )
-                return True, error_msg
+            info = db[student_id]
+            existing_name = info.get('name', 'Unknown')
+            existing_class = f"{info.get('branch', 'N/A')}-{info.get('section', 'N/A')}"
+            
+            error_msg = (
+                f"❌ DUPLICATE ROLL NUMBER!\n"
+                f"   Roll number '{roll_no}' already exists.\n"
+                f"   Belongs to: {existing_name} ({existing_class})"
+            )
+            return True, error_msg
         
         return False, ""
     
     @staticmethod
-    def check_duplicate_name(name, branch, section, exclude_student_id=None):
+    def check_duplicate_name(name, branch, section, exclude_student_id=None, db=None):
         """
         Check if student name already exists in the same class
         
@@ -139,45 +224,45 @@ class StudentValidator:
             branch: Branch
             section: Section
             exclude_student_id: Student ID to exclude from check
+            db: Already-loaded database (loaded here if None)
         
         Returns:
             (bool, str): (is_duplicate, warning_message)
         """
-        db = StudentValidator.load_database()
+        if db is None:
+            db = StudentValidator.load_database()
+        _, names = _duplicate_indexes(db)
         
-        name_lower = name.lower().strip()
+        # Same name in same class
+        name_key = (name.lower().strip(), branch.upper(), section.upper())
         
-        for student_id, info in db.items():
+        for student_id in names.get(name_key, ()):
             # Skip if this is the student being updated
             if exclude_student_id and student_id == exclude_student_id:
                 continue
             
-            # Check same name in same class
-            if (info.get('name', '').lower().strip() == name_lower and
-                info.get('branch', '').upper() == branch.upper() and
-                info.get('section', '').upper() == section.upper()):
-                
-                existing_roll = info.get('rollNo', 'N/A')
-                
-                warning_msg = (
-                    f"⚠️  WARNING: Similar name exists!\n"
-                    f"   '{name}' already registered in {branch}-{section}\n"
-                    f"   Roll number: {existing_roll}"
-                )
-                return True, warning_msg
+            existing_roll = db[student_id].get('rollNo', 'N/A')
+            
+            warning_msg = (
+                f"⚠️  WARNING: Similar name exists!\n"
+                f"   '{name}' already registered in {branch}-{section}\n"
+                f"   Roll number: {existing_roll}"
+            )
+            return True, warning_msg
         
         return False, ""
     
     @staticmethod
-    def generate_unique_student_id(name):
+    def generate_unique_student_id(name, db=None):
         """
         Generate unique student ID from name
         Handles duplicates by adding numbers
         """
         base_id = name.lower().strip().replace(" ", "_")
-        base_id = re.sub(r'[^a-z0-9_]', '', base_id)
+        base_id = _ID_SANITIZE_RE.sub('', base_id)
         
-        db = StudentValidator.load_database()
+        if db is None:
+            db = StudentValidator.load_database()
         
         if base_id not in db:
             return base_id
@@ -190,7 +275,7 @@ class StudentValidator:
         return f"{base_id}_{counter}"
     
     @staticmethod
-    def validate_student_data(name, roll_no, branch, section, check_duplicates=True):
+    def validate_student_data(name, roll_no, branch, section, check_duplicates=True, db=None):
         """
         Comprehensive validation of all student data
         
@@ -200,6 +285,7 @@ class StudentValidator:
             branch: Branch
             section: Section
             check_duplicates: Whether to check for duplicates
+            db: Already-loaded database (loaded here if None)
         
         Returns:
             dict: Validated and formatted data
@@ -214,13 +300,16 @@ class StudentValidator:
         
         # Check duplicates if requested
         if check_duplicates:
+            if db is None:
+                db = StudentValidator.load_database()
+            
             # Check roll number (critical - must be unique)
-            is_dup, error = StudentValidator.check_duplicate_roll_number(roll_no)
+            is_dup, error = StudentValidator.check_duplicate_roll_number(roll_no, db=db)
             if is_dup:
                 raise ValidationError(error)
             
             # Check name (warning only, don't block)
-            is_dup, warning = StudentValidator.check_duplicate_name(name, branch, section)
+            is_dup, warning = StudentValidator.check_duplicate_name(name, branch, section, db=db)
             if is_dup:
                 print(warning)
                 response = input("\n   Continue anyway? (yes/no): ").strip().lower()
@@ -278,31 +367,42 @@ def validate_and_add_student(name, roll_no, branch, section, images_count=0, dat
     from datetime import datetime
     
     try:
-        # Validate all data
+        # Load once and validate against it (may prompt about similar names)
+        db = StudentValidator.load_database()
         validated = StudentValidator.validate_student_data(
-            name, roll_no, branch, section, check_duplicates=True
+            name, roll_no, branch, section, check_duplicates=True, db=db
         )
         
-        # Generate unique ID
-        student_id = StudentValidator.generate_unique_student_id(validated['name'])
-        
-        # Load database
-        db = StudentValidator.load_database()
-        
-        # Add student
-        db[student_id] = {
-            "name": validated['name'],
-            "rollNo": validated['rollNo'],
-            "branch": validated['branch'],
-            "section": validated['section'],
-            "imagesCount": images_count,
-            "registeredDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "datasetPath": dataset_path
-        }
-        
-        # Save database
-        with open(Config.STUDENT_DB, 'w', encoding='utf-8') as f:
-            json.dump(db, indent=4, fp=f)
+        with _db_lock():
+            # Another process may have saved while we were prompting; the
+            # reload is only a stat when the file is unchanged
+            latest = StudentValidator.load_database()
+            if latest is not db:
+                is_dup, error = StudentValidator.check_duplicate_roll_number(
+                    validated['rollNo'], db=latest
+                )
+                if is_dup:
+                    raise ValidationError(error)
+            
+            # Copy: the loaded dict is shared with the cache/indexes
+            db = dict(latest)
+            
+            # Generate unique ID
+            student_id = StudentValidator.generate_unique_student_id(validated['name'], db=db)
+            
+            # Add student
+            db[student_id] = {
+                "name": validated['name'],
+                "rollNo": validated['rollNo'],
+                "branch": validated['branch'],
+                "section": validated['section'],
+                "imagesCount": images_count,
+                "registeredDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "datasetPath": dataset_path
+            }
+            
+            # Save database
+            save_database(db)
         
         print(f"✅ Student added successfully: {validated['name']} ({validated['rollNo']})")
         return True, student_id